@@ -1,5 +1,19 @@
-from .metrics import calculate_accuracy, calculate_bleu, calculate_rouge
-from .evaluator import evaluate
+import importlib
 
+# Public functions and the modules defining them. Metrics pull in numpy,
+# pandas and (for BERTScore) torch, so they are only imported when used;
+# `from evaluations import answer_extraction` stays cheap for the handlers.
+_EXPORTS = {
+    "calculate_accuracy": ".metrics",
+    "calculate_bleu": ".metrics",
+    "calculate_rouge": ".metrics",
+    "evaluate": ".evaluator",
+}
 
 
+def __getattr__(name):
+    # Keep `from evaluations import evaluate` working without eager imports
+    if name in _EXPORTS:
+        module = importlib.import_module(_EXPORTS[name], __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,144 @@
+import re
+from collections import namedtuple
+
+# Canonical option letters, in option order
+LETTERS = ["أ", "ب", "ج", "د", "هـ"]
+
+# Spellings of each option letter -> canonical letter. Latin letters are mapped
+# by position, so "C" from a model answering an Arabic question in English (or
+# an English dataset's "C. Ferritin") is the third option, ج.
+LETTER_VARIANTS = {
+    "أ": "أ", "ا": "أ", "إ": "أ", "آ": "أ",
+    "ب": "ب",
+    "ج": "ج",
+    "د": "د",
+    "ه": "هـ", "هـ": "هـ",
+    "A": "أ", "B": "ب", "C": "ج", "D": "د", "E": "هـ",
+}
+
+_LETTER = r"(هـ|[أاإآبجدهA-E])"
+_BOUNDARY_AFTER = r"(?![\w])"
+# Stripped around bare letters; colons are kept so an empty "A:" is no answer
+_DECORATION = " \t\n\r\"'`*()[]{}«».،,-"
+
+# "ب. البروتينات", "(ج) ...", "د) ...", "C. Ferritin". A Latin letter needs "." or
+# ")" and no lowercase word after it, so "E. coli" and "B-cell" are not options.
+OPTION_PREFIX = re.compile(r"^\(?(?:(هـ|[أاإآبجده])\s*[.)\-]|([A-E])\s*[.)](?!\s*[a-z]))")
+# Option lines of a question: "أ. الدهون"
+OPTION_LINE = re.compile(rf"^\s*\(?{_LETTER}\s*[.)\-]\s*(.+?)\s*$", re.MULTILINE)
+# Answer markers from instructions and prompts ("Correct letter:", "A:") and
+# from free-form answers ("الإجابة الصحيحة هي: ب", "the answer is B")
+ANSWER_MARKER = re.compile(
+    r"(?:الإجابة|الاجابة|الجواب)\s*(?:الصحيحة|الصحيح)?\s*(?:هي|هو)?\s*[:：]?"
+    r"|(?:answer|letter)(?:\s+(?:is|would\s+be)\s*[:：]?|\s*[:：])"
+    r"|(?<![\w])A\s*[:：]",
+    re.IGNORECASE,
+)
+# A letter followed by a colon is the next label ("A: \n B:"), not an answer
+MARKED_LETTER = re.compile(rf"^[\s\"'`*(\[«]*{_LETTER}{_BOUNDARY_AFTER}(?!\s*[:：])")
+
+# Strategy -> confidence, from most to least reliable. A letter elsewhere in
+# free text is never taken: "Vitamin D", "فيتامين د" or "Hepatitis A" are not answers.
+STRATEGIES = {
+    "exact": "high",           # the whole answer is a letter
+    "option_prefix": "high",   # the answer starts with a letter and separator
+    "answer_marker": "medium", # a letter right after the last answer marker
+    "option_text": "medium",   # the answer repeats one option's text
+    "none": None,
+}
+
+Extraction = namedtuple("Extraction", ["letter", "strategy", "confidence"])
+
+NO_ANSWER = Extraction(None, "none", None)
+
+
+def _found(letter, strategy):
+    return Extraction(LETTER_VARIANTS[letter], strategy, STRATEGIES[strategy])
+
+
+def parse_options(input_text):
+    """
+    Option texts of a multiple-choice question, keyed by canonical letter.
+    """
+    options = {}
+    for letter, text in OPTION_LINE.findall(input_text or ""):
+        options.setdefault(LETTER_VARIANTS[letter], text.strip(_DECORATION))
+    return options
+
+
+def extract_answer(text, input_text=None):
+    """
+    Extract the chosen option letter from a model answer or a ground truth.
+    Strategies are tried from the most to the least reliable (see STRATEGIES).
+    Args:
+        text (str): Model output or ground truth ("ب", "ب. البروتينات",
+            "الإجابة الصحيحة هي: ب", "Correct letter: C", ...).
+        input_text (str): The question with its options. When given, an answer
+            that repeats an option's text is mapped to that option.
+    Returns:
+        Extraction: (letter, strategy, confidence); letter is one of LETTERS or None.
+    """
+    if not isinstance(text, str):
+        return NO_ANSWER
+    text = text.strip()
+    if not text:
+        return NO_ANSWER
+
+    bare = text.strip(_DECORATION)
+    if bare in LETTER_VARIANTS:
+        return _found(bare, "exact")
+
+    match = OPTION_PREFIX.match(text)
+    if match:
+        return _found(match.group(1) or match.group(2), "option_prefix")
+
+    # Echoed prompts contain few-shot "A: ج" lines; only the last marker is the answer
+    markers = list(ANSWER_MARKER.finditer(text))
+    answer = text[markers[-1].end():] if markers else text
+    if markers:
+        match = MARKED_LETTER.match(answer)
+        if match:
+            return _found(match.group(1), "answer_marker")
+
+    if input_text:
+        answer_text = answer.strip(_DECORATION + ":：")
+        for letter, option_text in parse_options(input_text).items():
+            if answer_text and answer_text == option_text:
+                return Extraction(letter, "option_text", STRATEGIES["option_text"])
+
+    return NO_ANSWER
+
+
+def extract_letter(text, input_text=None):
+    """
+    The canonical option letter in `text`, or None.
+    """
+    return extract_answer(text, input_text).letter
+
+
+def extract_answers(texts, inputs=None):
+    """
+    Extract answers for a whole predictions column. Repeated answers (most
+    outputs are one of a handful of strings) are extracted once; the question
+    is only consulted for answers the text alone does not resolve.
+    Args:
+        texts (iterable of str): Model outputs or ground truths.
+        inputs (iterable of str): Optional questions, aligned with `texts`.
+    Returns:
+        pd.DataFrame: `letter`, `strategy` and `confidence` columns, one row per text.
+    """
+    import pandas as pd
+
+    index = texts.index if isinstance(texts, pd.Series) else None
+    texts = list(texts)
+    inputs = [None] * len(texts) if inputs is None else list(inputs)
+    memo = {}
+    rows = []
+    for text, input_text in zip(texts, inputs):
+        if text not in memo:
+            memo[text] = extract_answer(text)
+        extraction = memo[text]
+        if input_text and extraction.strategy == "none":
+            extraction = extract_answer(text, input_text)
+        rows.append(extraction)
+    return pd.DataFrame(rows, columns=list(Extraction._fields), index=index)
@@ -0,0 +1,39 @@
+import re
+from functools import lru_cache
+
+# Harakat, tanween, shadda, sukun, superscript alef and Quranic marks
+DIACRITICS = re.compile(r"[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED]")
+TATWEEL = "\u0640"
+
+# Spelling variants that are commonly used interchangeably
+CHARACTER_MAP = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",  # alef with hamza/madda/wasla
+    "ة": "ه",                              # taa marbuta
+    "ى": "ي",                              # alef maqsura
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},  # Arabic-Indic digits
+    **{chr(0x06F0 + digit): str(digit) for digit in range(10)},  # Extended (Persian) digits
+})
+
+WORD = re.compile(r"\w+")
+
+
+def normalize_arabic(text):
+    """
+    Normalize Arabic text for comparison: strip diacritics and tatweel, unify
+    alef variants, taa marbuta and alef maqsura, map Arabic digits to ASCII and
+    lowercase any Latin text.
+    """
+    text = DIACRITICS.sub("", str(text)).replace(TATWEEL, "")
+    return text.translate(CHARACTER_MAP).lower()
+
+
+@lru_cache(maxsize=200000)
+def tokenize(text):
+    """
+    Normalized word tokens of `text`; punctuation (Arabic and Latin) is dropped.
+    Results are cached, so references shared by many prediction files are
+    only normalized and tokenized once per process.
+    Returns:
+        tuple of str
+    """
+    return tuple(WORD.findall(normalize_arabic(text)))
@@ -0,0 +1,174 @@
+import os
+import re
+import json
+import fcntl
+import hashlib
+import logging
+from contextlib import contextmanager
+import numpy as np
+
+
+def text_key(text):
+    """
+    Stable key for a text in the embedding store.
+    """
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Persistent store of per-token contextual embeddings, one directory per encoder.
+
+    Token embeddings of all stored texts live in a single memory-mapped float16
+    matrix (`embeddings.f16`, one row per token) that only ever grows by appending.
+    `index.json` maps each text hash to its (row offset, token count) and is the
+    source of truth: rows past its count (left by a writer that crashed before
+    updating the index) are truncated before the next append. Writers hold an
+    exclusive file lock, so several processes can share one store.
+    """
+    def __init__(self, directory, encoder_name):
+        slug = re.sub(r"[^\w.-]+", "_", encoder_name).strip("_")
+        self.directory = os.path.join(directory, slug)
+        os.makedirs(self.directory, exist_ok=True)
+        self.encoder_name = encoder_name
+        self.data_path = os.path.join(self.directory, "embeddings.f16")
+        self.index_path = os.path.join(self.directory, "index.json")
+        self.lock_path = os.path.join(self.directory, ".lock")
+        self._load()
+
+    @contextmanager
+    def _locked(self):
+        with open(self.lock_path, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        else:
+            state = {"encoder": self.encoder_name, "dim": None, "rows": 0, "index": {}}
+        self.dim = state["dim"]
+        self.rows = state["rows"]
+        self.index = state["index"]
+        self._matrix = None
+        if self.rows:
+            self._matrix = np.memmap(self.data_path, dtype=np.float16, mode="r", shape=(self.rows, self.dim))
+
+    def __contains__(self, text):
+        return text_key(text) in self.index
+
+    def get(self, text):
+        """
+        Token embeddings of `text` as a (tokens, dim) float16 view, or None if missing.
+        """
+        entry = self.index.get(text_key(text))
+        if entry is None:
+            return None
+        offset, length = entry
+        return self._matrix[offset:offset + length]
+
+    def add(self, texts, embeddings):
+        """
+        Append token embeddings for texts not yet in the store.
+        Args:
+            texts (list of str): Texts that were encoded.
+            embeddings (list of np.ndarray): (tokens, dim) array per text.
+        """
+        with self._locked():
+            self._load()  # Pick up rows appended by other processes
+            new = {}
+            for text, embedding in zip(texts, embeddings):
+                key = text_key(text)
+                if key not in self.index and key not in new:
+                    new[key] = np.asarray(embedding, dtype=np.float16)
+            if not new:
+                return
+
+            dim = self.dim or next(iter(new.values())).shape[1]
+            offset = self.rows
+            with open(self.data_path, "ab") as f:
+                # Appends must start right after the rows the index knows about
+                indexed_bytes = self.rows * dim * np.dtype(np.float16).itemsize
+                size = os.fstat(f.fileno()).st_size
+                if size < indexed_bytes:
+                    raise ValueError(f"{self.data_path} holds {size} bytes but its index expects {indexed_bytes}")
+                if size > indexed_bytes:
+                    logging.warning(f"Dropping {size - indexed_bytes} unindexed bytes from {self.data_path}")
+                    f.truncate(indexed_bytes)
+                for key, embedding in new.items():
+                    f.write(np.ascontiguousarray(embedding).tobytes())
+                    self.index[key] = [offset, embedding.shape[0]]
+                    offset += embedding.shape[0]
+
+            state = {"encoder": self.encoder_name, "dim": int(dim), "rows": offset, "index": self.index}
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.index_path)
+            self._load()
+        logging.info(f"Embedding store {self.directory}: added {len(new)} texts ({self.rows} token rows)")
+
+
+def encode_tokens(scorer, texts):
+    """
+    Normalised per-token embeddings of `texts` from a bert_score BERTScorer,
+    including the special tokens bert_score uses for matching.
+    """
+    from collections import defaultdict
+    from bert_score.utils import get_bert_embedding
+
+    idf_dict = defaultdict(lambda: 1.0)
+    embeddings, masks, _ = get_bert_embedding(
+        texts, scorer._model, scorer._tokenizer, idf_dict,
+        batch_size=scorer.batch_size, device=scorer.device
+    )
+    embeddings = embeddings / embeddings.norm(dim=-1, keepdim=True)
+    lengths = masks.sum(dim=1).tolist()
+    return [
+        embeddings[i, :int(length)].float().cpu().numpy()
+        for i, length in enumerate(lengths)
+    ]
+
+
+def greedy_match(candidate, reference):
+    """
+    BERTScore precision, recall and F1 for one pair of normalised token matrices.
+    Every token can be matched, but the [CLS]/[SEP] tokens at both ends carry no
+    weight, as with bert_score's default (idf-free) weighting.
+    """
+    if candidate.shape[0] <= 2 or reference.shape[0] <= 2:
+        return 0.0, 0.0, 0.0
+    similarity = candidate.astype(np.float32) @ reference.astype(np.float32).T
+    precision = float(similarity.max(axis=1)[1:-1].mean())
+    recall = float(similarity.max(axis=0)[1:-1].mean())
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return precision, recall, f1
+
+
+def cached_bert_score(scorer, predictions, references, store_directory):
+    """
+    BERTScore with token embeddings served from an EmbeddingStore.
+    Each distinct text is encoded once per encoder and persisted, so references
+    shared by many prediction files are never re-embedded.
+    Returns:
+        tuple: per-example precision, recall and F1 arrays.
+    """
+    store = EmbeddingStore(store_directory, scorer.hash)
+    missing = list(dict.fromkeys(text for text in list(predictions) + list(references) if text not in store))
+    if missing:
+        # Encode in chunks to bound the size of the padded embedding tensor, and
+        # store them in one append so index.json is rewritten once per call
+        embeddings = []
+        for start in range(0, len(missing), 256):
+            embeddings.extend(encode_tokens(scorer, missing[start:start + 256]))
+        store.add(missing, embeddings)
+
+    scores = np.array([
+        greedy_match(store.get(prediction), store.get(reference))
+        for prediction, reference in zip(predictions, references)
+    ]).reshape(-1, 3)
+    return scores[:, 0], scores[:, 1], scores[:, 2]
@@ -1,38 +1,49 @@
 import json
-from evaluations.metrics import calculate_accuracy, calculate_bleu, calculate_rouge, calculate_bert_score
+from evaluations.metrics import calculate_accuracy, calculate_text_metrics, calculate_bert_score
 
-def evaluate(predictions_path, metrics_path, task_type):
+def evaluate(predictions_path, metrics_path, task_type, bert_batch_size=64, embedding_cache=None,
+             bert_score=True, workers=None):
     """
     Evaluate model predictions using task-specific metrics.
+    The BERTScore model is loaded once per process and reused across calls;
+    `embedding_cache` optionally names a directory of persisted token embeddings.
+    `bert_score=False` skips BERTScore, and `workers` caps the processes used
+    for BLEU/ROUGE on large files.
     """
     import pandas as pd
 
     #load predictions
     # Load predictions
-    predictions_df = pd.read_csv(predictions_path, dtype=str)  
+    # Missing predictions stay empty strings instead of becoming "nan"/"None"
+    predictions_df = pd.read_csv(predictions_path, dtype=str, keep_default_na=False)
     predictions = predictions_df['prediction'].astype(str).tolist()  
     ground_truths = predictions_df['ground_truth'].astype(str).tolist()  
+    inputs = predictions_df['input'].tolist() if 'input' in predictions_df else None
 
 
     metrics = {}
 
     if task_type == "qa":
-        metrics['accuracy'] = calculate_accuracy(predictions, ground_truths)
+        metrics['accuracy'] = calculate_accuracy(predictions, ground_truths, inputs)
     #elif task_type == "summarization":
     #    metrics['bleu'] = calculate_bleu(predictions, ground_truths)
 
     elif task_type == "fib_closed":
-        metrics['accuracy'] = calculate_accuracy(predictions, ground_truths)
+        metrics['accuracy'] = calculate_accuracy(predictions, ground_truths, inputs)
 
     elif task_type == "fib_open":
-        metrics['bleu'] = calculate_bleu(predictions, ground_truths)
-        metrics.update(calculate_rouge(predictions, ground_truths))
-        metrics.update(calculate_bert_score(predictions, ground_truths))
+        metrics.update(calculate_text_metrics(predictions, ground_truths, workers=workers))
+        if bert_score:
+            metrics.update(calculate_bert_score(
+                predictions, ground_truths, batch_size=bert_batch_size, embedding_cache=embedding_cache
+            ) or {})
 
     elif task_type == "aramed":
-        metrics['bleu'] = calculate_bleu(predictions, ground_truths)
-        metrics.update(calculate_rouge(predictions, ground_truths))
-        metrics.update(calculate_bert_score(predictions, ground_truths))
+        metrics.update(calculate_text_metrics(predictions, ground_truths, workers=workers))
+        if bert_score:
+            metrics.update(calculate_bert_score(
+                predictions, ground_truths, batch_size=bert_batch_size, embedding_cache=embedding_cache
+            ) or {})
         
     else:
         raise ValueError(f"Unsupported task type: {task_type}")
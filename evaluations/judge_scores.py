@@ -0,0 +1,171 @@
+import os
+import re
+import glob
+import json
+import logging
+import numpy as np
+import pandas as pd
+
+# Score lines required by datasets/prompt.txt: column prefix -> label
+JUDGE_CRITERIA = {
+    "similarity": "Similarity to ground truth",
+    "relevance": "Relevance/Helpfulness",
+    "factuality": "Factuality",
+    "safety": "Safety",
+}
+
+# "Label: 4 – explanation", tolerating markdown (**Label:** [4]) and "4/5"
+CRITERION_PATTERNS = {
+    name: re.compile(rf"{re.escape(label)}\W*([1-5])(?:\s*/\s*5)?\]?\s*[-–—:.]*\s*(.*)")
+    for name, label in JUDGE_CRITERIA.items()
+}
+
+JUDGES = ["gpt", "llama"]
+
+
+def parse_judgments(judgments):
+    """
+    Extract the four Likert scores and their explanations from raw judge outputs.
+    Args:
+        judgments (pd.Series): Free-text judgments; missing values are allowed.
+    Returns:
+        pd.DataFrame: `<criterion>_score` (nullable Int64) and
+        `<criterion>_explanation` columns, plus a boolean `malformed` column for
+        judgments missing any score.
+    """
+    texts = judgments.astype("string")
+    columns = {}
+    for name, pattern in CRITERION_PATTERNS.items():
+        extracted = texts.str.extract(pattern)
+        columns[f"{name}_score"] = pd.to_numeric(extracted[0]).astype("Int64")
+        columns[f"{name}_explanation"] = extracted[1].str.strip()
+    parsed = pd.DataFrame(columns, index=judgments.index)
+    parsed["malformed"] = parsed[[f"{name}_score" for name in JUDGE_CRITERIA]].isna().any(axis=1)
+    return parsed
+
+
+def add_judge_scores(df, judges=JUDGES):
+    """
+    Append parsed `<judge>_<criterion>_score/explanation` and `<judge>_malformed`
+    columns for every `<judge>_judgment` column present in `df`.
+    """
+    parsed = [
+        parse_judgments(df[f"{judge}_judgment"]).add_prefix(f"{judge}_")
+        for judge in judges if f"{judge}_judgment" in df
+    ]
+    return pd.concat([df, *parsed], axis=1)
+
+
+def bootstrap_ci(values, num_resamples=1000, confidence=0.95, seed=0):
+    """
+    Percentile bootstrap confidence interval of the mean.
+    Returns:
+        tuple: (low, high), or (None, None) for fewer than two values.
+    """
+    values = np.asarray(values, dtype=float)
+    if len(values) < 2:
+        return None, None
+    rng = np.random.default_rng(seed)
+    means = values[rng.integers(0, len(values), size=(num_resamples, len(values)))].mean(axis=1)
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(means, [alpha, 1 - alpha])
+    return float(low), float(high)
+
+
+def aggregate_scores(scored, judges=JUDGES, num_resamples=1000):
+    """
+    Per-judge mean score of each criterion with bootstrap CIs.
+    Malformed judgments are counted and left out of the means.
+    """
+    summary = {}
+    for judge in judges:
+        if f"{judge}_malformed" not in scored:
+            continue
+        valid = scored[~scored[f"{judge}_malformed"]]
+        judge_summary = {"rows": len(scored), "malformed": int(scored[f"{judge}_malformed"].sum())}
+        for name in JUDGE_CRITERIA:
+            values = valid[f"{judge}_{name}_score"].astype(float).to_numpy()
+            low, high = bootstrap_ci(values, num_resamples=num_resamples)
+            judge_summary[name] = {
+                "mean": float(values.mean()) if len(values) else None,
+                "ci_low": low,
+                "ci_high": high,
+                "n": int(len(values)),
+            }
+        summary[judge] = judge_summary
+    return summary
+
+
+def judgments_filename(predictions_path):
+    """
+    Judge output filename for a predictions file, following the existing naming:
+    `aramed_claude.csv` -> `claude_aramed_judge.csv`, `aramed_gec_claude.csv` ->
+    `claude_aramed_gec_judge.csv`. Inverse of `parse_judgments_filename`.
+    """
+    stem = os.path.splitext(os.path.basename(predictions_path))[0]
+    benchmark, _, model = stem.rpartition("_")
+    return f"{model}_{benchmark}_judge.csv" if benchmark else f"{stem}_judge.csv"
+
+
+def parse_judgments_filename(judgments_path):
+    """
+    (model, benchmark) of a judge output file written under `judgments_filename`,
+    e.g. `results/judgellm/claude_aramed_gec_judge.csv` -> ("claude", "aramed_gec").
+    Benchmark is None when the name has none.
+    """
+    stem = os.path.splitext(os.path.basename(judgments_path))[0]
+    if stem.endswith("_judge"):
+        stem = stem[:-len("_judge")]
+    model, _, benchmark = stem.partition("_")
+    return model, benchmark or None
+
+
+def score_judgment_files(patterns, metrics_path, scores_dir=None, num_resamples=1000):
+    """
+    Parse every judge CSV matching `patterns` and write per-benchmark,
+    per-model, per-judge score summaries to `metrics_path`.
+    Args:
+        patterns (list of str): Paths or glob patterns of judge CSVs.
+        metrics_path (str): Output JSON path.
+        scores_dir (str): Optional directory for `<name>_scores.csv` files with
+            the typed score columns next to the raw judgments.
+    Returns:
+        dict: benchmark -> model -> judge -> criterion summaries.
+    """
+    paths = sorted({path for pattern in patterns for path in (glob.glob(pattern) or [pattern])})
+    metrics = {}
+    for path in paths:
+        scored = add_judge_scores(pd.read_csv(path))
+        model, benchmark = parse_judgments_filename(path)
+        summary = aggregate_scores(scored, num_resamples=num_resamples)
+        metrics.setdefault(benchmark or "unknown", {})[model] = summary
+        if scores_dir:
+            os.makedirs(scores_dir, exist_ok=True)
+            stem = os.path.splitext(os.path.basename(path))[0]
+            scored.to_csv(os.path.join(scores_dir, f"{stem}_scores.csv"), index=False)
+        malformed = {judge: judge_summary["malformed"] for judge, judge_summary in summary.items()}
+        logging.info(f"Scored {path}: {len(scored)} rows, malformed judgments {malformed}")
+
+    with open(metrics_path, 'w') as f:
+        json.dump(metrics, f, indent=4)
+    return metrics
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Extract and aggregate LLM-judge scores.")
+    parser.add_argument(
+        "judgments",
+        nargs="*",
+        default=["results/judgellm/*_aramed_judge.csv"],
+        help="Judge CSVs or glob patterns (default: results/judgellm/*_aramed_judge.csv)",
+    )
+    parser.add_argument("--metrics-path", default="results/metrics/aramed_judge.json")
+    parser.add_argument("--scores-dir", help="Optional directory for per-file CSVs with parsed score columns")
+    parser.add_argument("--num-resamples", type=int, default=1000, help="Bootstrap resamples per CI")
+    args = parser.parse_args()
+
+    metrics = score_judgment_files(args.judgments, args.metrics_path, args.scores_dir, args.num_resamples)
+    print("Judge scores saved to:", args.metrics_path)
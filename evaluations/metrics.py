@@ -1,57 +1,69 @@
-import re
 import logging
-from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
-from rouge_score import rouge_scorer
-import torch
-from evaluate import load
-from sentence_transformers import SentenceTransformer, util
-import os
-from transformers import AutoTokenizer
+import threading
+from evaluations.embedding_store import cached_bert_score
+from evaluations.text_metrics import text_metrics
+from evaluations.answer_extraction import extract_answer, extract_answers
 
 
 
 def extract_letter(text):
     """
-    Extract the first MCQ letter from Arabic text.
-    Strips common phrases like "الإجابة الصحيحة هي:" first.
+    Extract the MCQ option letter from an answer or ground truth
+    (see `evaluations.answer_extraction`).
     """
-    if not text:
-        return None
-
-    text = text.strip()
-
-    # Common Arabic MCQ letters
-    arabic_choices = {'أ', 'ب', 'ج', 'د', 'هـ', 'ه'}
+    return extract_answer(text).letter
 
-    # Match first Arabic letter optionally followed by a dot or parenthesis
-    match = re.match(r'^([أبجدهـه])[\.\)]?', text)
-    if match:
-        letter = match.group(1)
-        return 'هـ' if letter in {'ه', 'هـ'} else letter
 
-    return None
+BERTSCORE_MODEL = "xlm-roberta-large"
 
+_bert_scorers = {}
+_bert_scorer_lock = threading.Lock()
 
 
-bertscore = load("bertscore")
-
-def calculate_bert_score(predictions, references):
+def get_bert_scorer(model_type=BERTSCORE_MODEL, batch_size=64):
+    """
+    Return the process-wide BERTScorer for `model_type`, loading it on first use.
+    The model runs on GPU when one is available and on CPU otherwise, and is
+    reused by every later call in the same process.
+    """
+    with _bert_scorer_lock:
+        if model_type not in _bert_scorers:
+            import torch
+            from bert_score import BERTScorer
+
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+            logging.info(f"Loading BERTScore model {model_type} on {device}")
+            _bert_scorers[model_type] = BERTScorer(
+                model_type=model_type,
+                #model_type="bert-base-multilingual-cased",
+                lang="ar",
+                device=device,
+                batch_size=batch_size
+            )
+        scorer = _bert_scorers[model_type]
+        scorer.batch_size = batch_size
+        return scorer
+
+
+def calculate_bert_score(predictions, references, batch_size=64, embedding_cache=None):
+    """
+    Mean BERTScore precision, recall and F1.
+    With `embedding_cache` (a directory), token embeddings are read from and
+    written to a persistent EmbeddingStore, so each distinct text is embedded
+    only once per encoder across prediction files and runs.
+    """
     try:
-        os.environ["CUDA_VISIBLE_DEVICES"] = "0"  # Switch to GPU 1
-        results = bertscore.compute(
-            predictions=predictions,
-            references=references,
-            #model_type="bert-base-multilingual-cased",  
-            model_type="xlm-roberta-large",
-            lang="ar",  
-            device="cuda"
-        )
-        print("model used: ", results["hashcode"])
+        scorer = get_bert_scorer(batch_size=batch_size)
+        if embedding_cache:
+            precision, recall, f1 = cached_bert_score(scorer, predictions, references, embedding_cache)
+        else:
+            precision, recall, f1 = scorer.score(predictions, references)
+        print("model used: ", scorer.hash)
         #return mean scores
         return {
-            "bert_precision": sum(results["precision"]) / len(results["precision"]),
-            "bert_recall": sum(results["recall"]) / len(results["recall"]),
-            "bert_f1": sum(results["f1"]) / len(results["f1"])
+            "bert_precision": precision.mean().item(),
+            "bert_recall": recall.mean().item(),
+            "bert_f1": f1.mean().item()
         }
     except Exception as e:
         print(f"Error calculating BERTScore: {e}")
@@ -83,53 +95,44 @@ def calculate_bert_score(predictions, references):
 
 
 
-def calculate_accuracy(predictions, ground_truths):
-    correct = 0
-    for p, g in zip(predictions, ground_truths):
-        # p is either something like "أ" or None
-        if p is None:
-            # automatically wrong
-            continue
-        # ground truth might be "أ. نص" so let's parse the letter from it
-        g_letter = extract_letter(str(g))
-        if p == g_letter:
-            correct += 1
+def calculate_accuracy(predictions, ground_truths, inputs=None):
+    """
+    Share of predictions whose extracted option letter matches the ground
+    truth's. Letters are extracted from the raw outputs, so older prediction
+    files can be re-scored without regenerating them. `inputs` (the questions)
+    lets answers that repeat an option's text count as that option.
+    """
+    if not ground_truths:
+        return 0
+    predicted = extract_answers(predictions, inputs)["letter"]
+    expected = extract_answers(ground_truths)["letter"]
+    # A missing prediction is wrong, even for a ground truth without a letter
+    correct = predicted.notna() & (predicted == expected)
+    return int(correct.sum()) / len(ground_truths)
+
 
-    return correct / len(ground_truths) if ground_truths else 0
+def calculate_text_metrics(predictions, ground_truths, workers=None):
+    """
+    Mean BLEU, ROUGE-1/2/L F1 and exact match from one pass of the fast
+    text-metrics backend (texts are normalized and tokenized once and shared
+    by all metrics).
+    """
+    scores = text_metrics(predictions, ground_truths, workers=workers)
+    return {name: float(values.mean()) if len(values) else 0 for name, values in scores.items()}
 
 
 def calculate_bleu(predictions, ground_truths):
     """
     Calculate BLEU scores for each prediction against the corresponding ground truth.
-    Returns the average BLEU score.
-    """
-    smoothing_function = SmoothingFunction().method1
-    scores = []
-    for pred, gt in zip(predictions, ground_truths):
-        pred = str(pred)
-        gt = str(gt)
-        scores.append(sentence_bleu([gt.split()], pred.split(), smoothing_function=smoothing_function))
-    
-    return sum(scores) / len(scores) if scores else 0
+    Returns the average BLEU score (sentence BLEU with NLTK's smoothing method1).
+    """
+    return calculate_text_metrics(predictions, ground_truths)["bleu"]
 
 
 def calculate_rouge(predictions, ground_truths):
     """
-    Calculate ROUGE scores using the rouge_scorer library.
+    Calculate ROUGE scores on normalized Arabic tokens.
     Returns the average ROUGE-1, ROUGE-2, and ROUGE-L scores.
     """
-    scorer = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'], use_stemmer=True)
-    rouge1, rouge2, rougeL = 0, 0, 0
-
-    for pred, gt in zip(predictions, ground_truths):
-        scores = scorer.score(gt, pred)
-        rouge1 += scores['rouge1'].fmeasure
-        rouge2 += scores['rouge2'].fmeasure
-        rougeL += scores['rougeL'].fmeasure
-
-    count = len(predictions)
-    return {
-        "rouge1": rouge1 / count if count else 0,
-        "rouge2": rouge2 / count if count else 0,
-        "rougeL": rougeL / count if count else 0
-    }
+    metrics = calculate_text_metrics(predictions, ground_truths)
+    return {name: metrics[name] for name in ("rouge1", "rouge2", "rougeL")}
@@ -0,0 +1,116 @@
+import math
+from evaluations.answer_extraction import extract_answer
+from evaluations.arabic_text import tokenize
+from evaluations.text_metrics import score_tokens
+
+# Two-sided 95% normal quantile
+Z_95 = 1.959964
+
+
+class RunningMean:
+    """
+    Constant-memory running mean and variance (Welford's algorithm).
+    Proportions (`binary=True`) get a Wilson score interval, which stays
+    informative near 0 and 1 where the normal interval collapses.
+    """
+    def __init__(self, binary=False):
+        self.binary = binary
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def update(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def interval(self, z=Z_95):
+        """
+        Confidence interval of the mean, or (None, None) before any update.
+        """
+        n = self.count
+        if n == 0:
+            return None, None
+        if self.binary:
+            center = (self.mean + z * z / (2 * n)) / (1 + z * z / n)
+            half = z * math.sqrt(self.mean * (1 - self.mean) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+            return center - half, center + half
+        half = z * math.sqrt(self.variance / n)
+        return self.mean - half, self.mean + half
+
+
+class StreamingEvaluator:
+    """
+    Scores prediction records one at a time as they are generated, keeping
+    only running aggregates per metric.
+
+    MCQ tasks (qa, fib_closed) track accuracy and the share of predictions from
+    which an option letter can be extracted; open-ended tasks (fib_open, aramed)
+    track BLEU, ROUGE and exact match on normalized Arabic tokens. BERTScore
+    needs the encoder and is left to the final evaluation. Records without a
+    ground truth are skipped.
+    """
+    def __init__(self, task_type):
+        if task_type in ["qa", "fib_closed"]:
+            self.metrics = {"accuracy": RunningMean(binary=True), "valid_answer_rate": RunningMean(binary=True)}
+        elif task_type in ["fib_open", "aramed"]:
+            self.metrics = {
+                "bleu": RunningMean(),
+                "rouge1": RunningMean(),
+                "rouge2": RunningMean(),
+                "rougeL": RunningMean(),
+                "exact_match": RunningMean(binary=True),
+            }
+        else:
+            raise ValueError(f"Unsupported task type: {task_type}")
+        self.task_type = task_type
+
+    @property
+    def count(self):
+        return next(iter(self.metrics.values())).count
+
+    def score(self, prediction, ground_truth, input_text=None):
+        """
+        Metric values of a single prediction.
+        """
+        if self.task_type in ["qa", "fib_closed"]:
+            # Same rule as calculate_accuracy: a missing prediction is wrong
+            extraction = extract_answer(prediction, input_text)
+            correct = extraction.letter is not None and extraction.letter == extract_answer(str(ground_truth)).letter
+            return {"accuracy": float(correct), "valid_answer_rate": float(extraction.letter is not None)}
+
+        prediction = "" if prediction is None else prediction
+        scores = score_tokens([tokenize(prediction)], [tokenize(ground_truth)])
+        return {name: float(values[0]) for name, values in scores.items()}
+
+    def update(self, record):
+        """
+        Add one prediction record (with `prediction`, `ground_truth` and
+        optionally `input` keys). Records without a ground truth are ignored.
+        """
+        if record.get("ground_truth") is None:
+            return
+        scores = self.score(record.get("prediction"), record.get("ground_truth"), record.get("input"))
+        for name, value in scores.items():
+            self.metrics[name].update(value)
+
+    def summary(self):
+        """
+        Current estimate and 95% confidence interval of every metric.
+        """
+        summary = {}
+        for name, running in self.metrics.items():
+            low, high = running.interval()
+            summary[name] = {"mean": running.mean, "ci_low": low, "ci_high": high, "n": running.count}
+        return summary
+
+    def format(self):
+        return ", ".join(
+            f"{name}={stats['mean']:.3f} [{stats['ci_low']:.3f}, {stats['ci_high']:.3f}]"
+            for name, stats in self.summary().items() if stats["n"]
+        )
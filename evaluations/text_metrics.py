@@ -0,0 +1,167 @@
+import os
+import math
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from evaluations.arabic_text import tokenize
+
+# Above this many pairs, `text_metrics` splits the work across processes
+PARALLEL_THRESHOLD = 5000
+
+_HASH_BASE = np.uint64(1000003)
+_EXAMPLE_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def encode(token_lists, vocabulary):
+    """
+    Flatten tokenized texts into one uint64 id array plus the example index of
+    every token.
+    """
+    lengths = np.fromiter((len(tokens) for tokens in token_lists), dtype=np.int64, count=len(token_lists))
+    ids = np.fromiter(
+        (vocabulary.setdefault(token, len(vocabulary) + 1) for tokens in token_lists for token in tokens),
+        dtype=np.uint64,
+        count=int(lengths.sum()),
+    )
+    examples = np.repeat(np.arange(len(token_lists), dtype=np.int64), lengths)
+    return ids, examples, lengths
+
+
+def ngram_keys(ids, examples, max_order):
+    """
+    Hashed n-gram keys of every order up to `max_order`, computed with a rolling
+    polynomial hash over the flat token array. Each key also mixes in its
+    example index, so a single `np.unique` counts n-grams per example.
+    Returns:
+        list: for each order, (keys, example index) arrays of the n-grams that
+        do not cross an example boundary.
+    """
+    orders = []
+    hashes = ids.copy()
+    for n in range(1, max_order + 1):
+        if n > 1:
+            hashes = hashes[:-1] * _HASH_BASE + ids[n - 1:]
+        starts = examples[:len(hashes)]
+        valid = starts == examples[n - 1:]
+        example_index = starts[valid]
+        keys = hashes[valid] ^ (example_index.astype(np.uint64) * _EXAMPLE_MIX)
+        orders.append((keys, example_index))
+    return orders
+
+
+def clipped_matches(candidate, reference, num_examples):
+    """
+    Per-example sum over n-grams of min(candidate count, reference count).
+    """
+    candidate_keys, first, candidate_counts = np.unique(candidate[0], return_index=True, return_counts=True)
+    reference_keys, reference_counts = np.unique(reference[0], return_counts=True)
+    if len(reference_keys) == 0 or len(candidate_keys) == 0:
+        return np.zeros(num_examples)
+    position = np.minimum(np.searchsorted(reference_keys, candidate_keys), len(reference_keys) - 1)
+    found = reference_keys[position] == candidate_keys
+    clipped = np.where(found, np.minimum(candidate_counts, reference_counts[position]), 0)
+    return np.bincount(candidate[1][first], weights=clipped, minlength=num_examples)
+
+
+def lcs_length(candidate, reference):
+    """
+    Longest common subsequence length with the bit-parallel algorithm of
+    Allison-Dix/Hyyrö: one row of the DP table is a single integer bitmask,
+    updated with a few integer operations per candidate token.
+    """
+    if not candidate or not reference:
+        return 0
+    masks = {}
+    for position, token in enumerate(reference):
+        masks[token] = masks.get(token, 0) | (1 << position)
+    full = (1 << len(reference)) - 1
+    row = full
+    for token in candidate:
+        matches = row & masks.get(token, 0)
+        row = ((row + matches) | (row - matches)) & full
+    return len(reference) - bin(row).count("1")
+
+
+def f_measure(overlap, candidate_total, reference_total):
+    precision = overlap / np.maximum(candidate_total, 1)
+    recall = overlap / np.maximum(reference_total, 1)
+    total = precision + recall
+    return np.divide(2 * precision * recall, total, out=np.zeros_like(total, dtype=float), where=total > 0)
+
+
+def score_tokens(candidates, references):
+    """
+    Sentence BLEU (4-gram, NLTK smoothing method1), ROUGE-1/2/L F1 and exact
+    match for pre-tokenized pairs.
+    Returns:
+        dict: metric name -> per-example numpy array.
+    """
+    num_examples = len(candidates)
+    if num_examples == 0:
+        return {name: np.zeros(0) for name in ("bleu", "rouge1", "rouge2", "rougeL", "exact_match")}
+
+    vocabulary = {}
+    candidate_ids, candidate_examples, candidate_lengths = encode(candidates, vocabulary)
+    reference_ids, reference_examples, reference_lengths = encode(references, vocabulary)
+    candidate_ngrams = ngram_keys(candidate_ids, candidate_examples, 4)
+    reference_ngrams = ngram_keys(reference_ids, reference_examples, 4)
+
+    matches = [
+        clipped_matches(candidate, reference, num_examples)
+        for candidate, reference in zip(candidate_ngrams, reference_ngrams)
+    ]
+    candidate_totals = [np.maximum(candidate_lengths - n + 1, 0) for n in range(1, 5)]
+    reference_totals = [np.maximum(reference_lengths - n + 1, 0) for n in range(1, 5)]
+
+    # BLEU: smoothed modified precisions, zero without any unigram match
+    log_precision = np.zeros(num_examples)
+    for n in range(4):
+        numerator = np.where(matches[n] == 0, 0.1, matches[n])
+        log_precision += 0.25 * np.log(numerator / np.maximum(candidate_totals[n], 1))
+    with np.errstate(divide="ignore"):
+        brevity = np.where(
+            candidate_lengths > reference_lengths,
+            1.0,
+            np.exp(1 - reference_lengths / np.maximum(candidate_lengths, 1)),
+        )
+    bleu = np.where(matches[0] == 0, 0.0, brevity * np.exp(log_precision))
+
+    lcs = np.array([lcs_length(c, r) for c, r in zip(candidates, references)], dtype=float)
+
+    return {
+        "bleu": bleu,
+        "rouge1": f_measure(matches[0], candidate_totals[0], reference_totals[0]),
+        "rouge2": f_measure(matches[1], candidate_totals[1], reference_totals[1]),
+        "rougeL": f_measure(lcs, candidate_lengths, reference_lengths),
+        "exact_match": np.array([c == r for c, r in zip(candidates, references)], dtype=float),
+    }
+
+
+def _score_texts(predictions, references):
+    return score_tokens([tokenize(text) for text in predictions], [tokenize(text) for text in references])
+
+
+def text_metrics(predictions, references, workers=None):
+    """
+    Per-example BLEU, ROUGE-1/2/L and exact match for prediction/reference
+    pairs, all on normalized Arabic tokens (see `evaluations.arabic_text`).
+    Each text is tokenized once for all metrics. Files larger than
+    PARALLEL_THRESHOLD pairs are split across `workers` processes
+    (default: all CPUs).
+    Returns:
+        dict: metric name -> per-example numpy array.
+    """
+    predictions = [str(text) for text in predictions]
+    references = [str(text) for text in references]
+    workers = workers or os.cpu_count() or 1
+    if len(predictions) <= PARALLEL_THRESHOLD or workers == 1:
+        return _score_texts(predictions, references)
+
+    chunk = math.ceil(len(predictions) / workers)
+    bounds = [(start, start + chunk) for start in range(0, len(predictions), chunk)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        parts = list(executor.map(
+            _score_texts,
+            [predictions[start:end] for start, end in bounds],
+            [references[start:end] for start, end in bounds],
+        ))
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
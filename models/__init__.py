@@ -1,19 +1,83 @@
-from .openai_handler import OpenAIHandler
-from .huggingface_handler import HuggingFaceHandler
+import importlib
+import os  # To access environment variables
+
 from .model_handler_base import ModelHandlerBase
-from .anthropic_handler import Claude35SonnetHandler
-from .gemini_handler import GeminiHandler
-from .deepseek_handler import DeepSeekHandler 
-from .medgemma import medgemma 
+from .response_cache import ResponseCache, CachedModelHandler
+from .hf_utils import set_hf_home
+
+# Handler classes and the modules defining them. A handler module is only
+# imported when it is used, so API-only runs never import torch/transformers
+# or need a Hugging Face token.
+_HANDLER_MODULES = {
+    "OpenAIHandler": ".openai_handler",
+    "HuggingFaceHandler": ".huggingface_handler",
+    "Claude35SonnetHandler": ".anthropic_handler",
+    "GeminiHandler": ".gemini_handler",
+    "DeepSeekHandler": ".deepseek_handler",
+    "medgemma": ".medgemma",
+}
+
+# Handler modules that import transformers at module level
+_HF_MODULES = {".huggingface_handler", ".medgemma"}
+
+
+def _handler_class(name):
+    if _HANDLER_MODULES[name] in _HF_MODULES:
+        set_hf_home()  # Before transformers/huggingface_hub read it on import
+    module = importlib.import_module(_HANDLER_MODULES[name], __name__)
+    return getattr(module, name)
+
+
+def __getattr__(name):
+    # Keep `from models import OpenAIHandler` working without eager imports
+    if name in _HANDLER_MODULES:
+        return _handler_class(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-import os  # To access environment variables
 
 def load_model_handler(config):
     """
     Factory method to load the appropriate model handler based on config.
+    If the config has an enabled `cache` section, the handler is wrapped in a
+    CachedModelHandler backed by a persistent ResponseCache.
 
+    """
+    handler = _create_model_handler(config)
+
+    cache_config = config.get("cache") or {}
+    if not cache_config.get("enabled", False):
+        return handler
+
+    cache = ResponseCache(
+        path=cache_config.get("path", "cache/responses.sqlite"),
+        max_entries=cache_config.get("max_entries"),
+        max_age_days=cache_config.get("max_age_days"),
+    )
+    return CachedModelHandler(
+        handler,
+        cache,
+        handler_type=config["model"]["type"],
+        model_name=config["model"]["name"],
+        cache_sampled=cache_config.get("sampled", False),
+    )
+
+
+def _create_model_handler(config):
+    """
+    Instantiate the uncached handler for `config["model"]["type"]`.
     """
     model_type = config["model"]["type"]
+    generation_params = config.get("generation")
+
+    # Client-side limits for API providers; the adaptive in-flight cap starts
+    # at the configured concurrency
+    rate_limit = dict(config.get("rate_limit") or {})
+    concurrency = config.get("execution", {}).get("concurrency", 1)
+    if concurrency > 1:
+        rate_limit.setdefault("max_concurrency", concurrency)
+
+    # Connection pool settings shared by the OpenAI, DeepSeek and Anthropic clients
+    http = config.get("http") or {}
 
     if model_type == "openai":
         # retrieve API key from environment
@@ -22,21 +86,29 @@ def load_model_handler(config):
             raise ValueError(
                 "API key is not provided in config or environment variable (OPENAI_API_KEY)."
             )
-        return OpenAIHandler(
+        return _handler_class("OpenAIHandler")(
             api_key=api_key,
-            model=config["model"]["name"]
+            model=config["model"]["name"],
+            generation_params=generation_params,
+            base_url=config["model"].get("base_url"),
+            rate_limit=rate_limit,
+            http=http
         )
     elif model_type == "huggingface":
-        return HuggingFaceHandler(
+        return _handler_class("HuggingFaceHandler")(
             model_name=config["model"]["name"],
-            cache_dir=config.get("cache_dir", None)
+            cache_dir=config.get("cache_dir", None),
+            generation_params=generation_params,
+            mcq_mode=config["model"].get("mcq_mode", "generate"),
+            prefix_cache=config["model"].get("prefix_cache", False)
             #device=config["model"].get("device", "cpu")
         )
 
     elif model_type == "medgemma":
-        return medgemma(
+        return _handler_class("medgemma")(
             model_name=config["model"]["name"],
-            cache_dir=config.get("cache_dir", None)
+            cache_dir=config.get("cache_dir", None),
+            prefix_cache=config["model"].get("prefix_cache", False)
             #device=config["model"].get("device", "cpu")
         )
 
@@ -47,16 +119,25 @@ def load_model_handler(config):
             raise ValueError(
                 "API key is not provided in config or environment variable (OPENAI_API_KEY)."
             )
-        return GeminiHandler(
+        return _handler_class("GeminiHandler")(
             api_key=api_key,
-            model=config["model"]["name"]
+            model=config["model"]["name"],
+            generation_params=generation_params,
+            rate_limit=rate_limit
         )
 
     elif model_type == "deepseek":  # 
         api_key = config["model"].get("api_key", os.getenv("DEEPSEEK_API_KEY"))
         if not api_key:
             raise ValueError("API key is not provided for DeepSeek.")
-        return DeepSeekHandler(api_key=api_key, model=config["model"]["name"])
+        return _handler_class("DeepSeekHandler")(
+            api_key=api_key,
+            model=config["model"]["name"],
+            generation_params=generation_params,
+            base_url=config["model"].get("base_url", "https://api.deepseek.com/v1"),
+            rate_limit=rate_limit,
+            http=http
+        )
 
     elif model_type == "anthropic":
         # Retrieve Anthropic API key from environment or config
@@ -65,9 +146,12 @@ def load_model_handler(config):
             raise ValueError(
                 "API key is not provided in config or environment variable (ANTHROPIC_API_KEY)."
             )
-        return Claude35SonnetHandler(
+        return _handler_class("Claude35SonnetHandler")(
             api_key=api_key,
-            model_name=config["model"].get("name", "claude-3-5-sonnet-20240620")
+            model_name=config["model"].get("name", "claude-3-5-sonnet-20240620"),
+            generation_params=generation_params,
+            rate_limit=rate_limit,
+            http=http
         )
     
     else:
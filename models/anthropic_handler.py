@@ -1,59 +1,77 @@
 import anthropic
+import asyncio
 from models.model_handler_base import ModelHandlerBase
-import re
-
-def extract_letter_from_text(text):
-        """
-        Clean and extract a single Arabic MCQ letter from model-generated output.
-        Handles noisy output like:
-        - "الإجابة الصحيحة هي: ب. ..."
-        - "الإجابة: ج"
-        - "ج. يسمى هذا ..."
-        """
-        if not text:
-            return None
-    
-        # Normalize and remove leading Arabic answer patterns
-        text = text.strip()
-        text = re.sub(r"(الإجابة\s*(الصحيحة)?\s*(هي)?\s*[:：]?)", "", text)
-        text = re.sub(r"(الجواب\s*(الصحيح)?\s*(هو)?\s*[:：]?)", "", text)
-        text = text.strip()
-    
-        # Remove all Arabic text before first letter (if still present)
-        match = re.search(r"([أبجدهـه])", text)
-        if match:
-            letter = match.group(1)
-            return 'هـ' if letter in {'ه', 'هـ'} else letter
-    
-        return None
+from models.rate_limit import get_limiter, estimate_tokens, log_request_failure
+from models.http_clients import get_http_client, get_async_http_client
 
+DEFAULT_SYSTEM_PROMPT = "This is a multiple-choice question, choose the correct option. The output should consist only of the single letter of the correct answer with no explanation"
 
 class Claude35SonnetHandler(ModelHandlerBase):
     """
     Handler for Anthropic's Claude 3.5 Sonnet model (post-March 2024 API).
     """
-    def __init__(self, api_key, model_name="claude-3-5-sonnet-20240620"):
-        self.client = anthropic.Anthropic(api_key="")
+    def __init__(self, api_key, model_name="claude-3-5-sonnet-20240620", generation_params=None, rate_limit=None,
+                 http=None):
+        # Retries and rate limiting are handled by the shared "anthropic" limiter
+        self.client = anthropic.Anthropic(
+            api_key=api_key,
+            max_retries=0,
+            http_client=get_http_client("anthropic", **(http or {}))
+        )
+        self.http = http or {}
+        self._async_client = None
         self.model_name = model_name
+        self.limiter = get_limiter("anthropic", **(rate_limit or {}))
+        self.generation_params = {"temperature": 0.4, "max_tokens": 100}
+        self.generation_params.update(generation_params or {})
+
+    def _request_params(self, input_text, system_prompt, task, kwargs):
+        max_tokens = 5 if task == "fib_open" else kwargs.get("max_tokens", self.generation_params["max_tokens"])
+        return {
+            "model": self.model_name,
+            "max_tokens": max_tokens,
+            "temperature": kwargs.get("temperature", self.generation_params["temperature"]),
+            "system": system_prompt,
+            "messages": [{"role": "user", "content": input_text}]
+        }
 
-    def prompt(self, input_text, task=" ", system_prompt="This is a multiple-choice question, choose the correct option. The output should consist only of the single letter of the correct answer with no explanation", **kwargs):
-        max_tokens = 5 if task == "fib_open" else kwargs.get("max_tokens", 100)
+    def prompt(self, input_text, system_prompt=DEFAULT_SYSTEM_PROMPT, task=" ", **kwargs):
+        params = self._request_params(input_text, system_prompt, task, kwargs)
         try:
-            response = self.client.messages.create(
-                model=self.model_name,
-                max_tokens=max_tokens,
-                temperature=kwargs.get("temperature", 0.4),
-                system=system_prompt,
-                messages=[{"role": "user", "content": input_text}]
+            response = self.limiter.call(
+                lambda: self.client.messages.create(**params),
+                estimated_tokens=estimate_tokens(system_prompt, input_text, max_tokens=params["max_tokens"])
             )
     
             raw_output = response.content[0].text.strip() if response.content else "No response generated."
             return raw_output
-            #extract_letter_from_text(raw_output)  # <- crucial
     
         except Exception as e:
-            print(f"Error during Claude prompt: {e}")
+            log_request_failure("anthropic", input_text, e)
             return None
 
-    
+    def get_async_client(self):
+        """
+        AsyncAnthropic client for the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client[0] is not loop:
+            self._async_client = (loop, anthropic.AsyncAnthropic(
+                api_key=self.client.api_key,
+                max_retries=0,
+                http_client=get_async_http_client("anthropic", **self.http)
+            ))
+        return self._async_client[1]
 
+    async def aprompt(self, input_text, system_prompt=DEFAULT_SYSTEM_PROMPT, task=" ", **kwargs):
+        params = self._request_params(input_text, system_prompt, task, kwargs)
+        try:
+            client = self.get_async_client()
+            response = await self.limiter.acall(
+                lambda: client.messages.create(**params),
+                estimated_tokens=estimate_tokens(system_prompt, input_text, max_tokens=params["max_tokens"])
+            )
+            return response.content[0].text.strip() if response.content else "No response generated."
+        except Exception as e:
+            log_request_failure("anthropic", input_text, e)
+            return None
@@ -1,36 +1,95 @@
-from openai import OpenAI
+import asyncio
+from openai import OpenAI, AsyncOpenAI
+from models.model_handler_base import ModelHandlerBase
+from models.rate_limit import get_limiter, estimate_tokens, log_request_failure
+from models.openai_batch import OpenAIBatchMixin
+from models.http_clients import get_http_client, get_async_http_client
 
-class DeepSeekHandler:
-    def __init__(self, api_key, model="deepseek-chat"):
+class DeepSeekHandler(OpenAIBatchMixin, ModelHandlerBase):
+    def __init__(self, api_key, model="deepseek-chat", generation_params=None,
+                 base_url="https://api.deepseek.com/v1", rate_limit=None, http=None):
         """
         Initialize the DeepSeek handler using OpenAI-compatible API.
+        Retries and rate limiting are handled by the shared "deepseek" limiter.
         """
         self.client = OpenAI(
             api_key=api_key,
-            base_url="https://api.deepseek.com/v1"  # DeepSeek's API endpoint
+            base_url=base_url,  # DeepSeek's API endpoint
+            max_retries=0,
+            http_client=get_http_client("deepseek", base_url, **(http or {}))
         )
+        self.base_url = base_url
+        self.http = http or {}
+        self._async_client = None
+        self.limiter = get_limiter("deepseek", **(rate_limit or {}))
         self.model = model  # "deepseek-chat" invokes DeepSeek-V3
+        self.generation_params = {
+            "temperature": 0.4,
+            "max_tokens": 1000,
+            "top_p": 1.0,
+            "frequency_penalty": 0.0,
+            "presence_penalty": 0.0
+        }
+        self.generation_params.update(generation_params or {})
 
     def prompt(self, question, instruction, task_type=" "):
         """
         Generate a response from the DeepSeek model for a given question.
         """
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": instruction},
-                    {"role": "user", "content": question}
-                ],
-                temperature=0.4,
-                max_tokens=1000,
-                top_p=1.0,
-                frequency_penalty=0.0,
-                presence_penalty=0.0
+            response = self.limiter.call(
+                lambda: self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": instruction},
+                        {"role": "user", "content": question}
+                    ],
+                    **self.generation_params
+                ),
+                estimated_tokens=estimate_tokens(
+                    instruction, question, max_tokens=self.generation_params.get("max_tokens")
+                )
             )
             return response.choices[0].message.content.strip()
 
         except Exception as e:
-            print(f"Error occurred while processing the question: {question}")
-            print(f"Error details: {str(e)}")
+            log_request_failure("deepseek", question, e)
+            return None
+
+    def get_async_client(self):
+        """
+        AsyncOpenAI client for the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client[0] is not loop:
+            self._async_client = (loop, AsyncOpenAI(
+                api_key=self.client.api_key,
+                base_url=self.base_url,
+                max_retries=0,
+                http_client=get_async_http_client("deepseek", self.base_url, **self.http)
+            ))
+        return self._async_client[1]
+
+    async def aprompt(self, question, instruction, task_type=" "):
+        """
+        Async version of `prompt`.
+        """
+        try:
+            client = self.get_async_client()
+            response = await self.limiter.acall(
+                lambda: client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": instruction},
+                        {"role": "user", "content": question}
+                    ],
+                    **self.generation_params
+                ),
+                estimated_tokens=estimate_tokens(
+                    instruction, question, max_tokens=self.generation_params.get("max_tokens")
+                )
+            )
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            log_request_failure("deepseek", question, e)
             return None
@@ -1,9 +1,14 @@
 import google.generativeai as genai
 import os
-import re
+import logging
+from models.model_handler_base import ModelHandlerBase
+from models.rate_limit import get_limiter, estimate_tokens, log_request_failure
+from evaluations.answer_extraction import extract_letter
 
-class GeminiHandler:
-    def __init__(self, api_key=None, model="gemini-1.5-pro"):
+class GeminiHandler(ModelHandlerBase):
+    extracts_answers = True
+
+    def __init__(self, api_key=None, model="gemini-1.5-pro", generation_params=None, rate_limit=None):
         """
         Initialize the Gemini handler.
         """
@@ -15,6 +20,30 @@ class GeminiHandler:
 
         genai.configure(api_key=api_key)
         self.client = genai.GenerativeModel(model_name=model)
+        self.model = model
+        self.generation_params = {
+            "temperature": 1.0,  # More deterministic output
+            "max_output_tokens": 100  # optional: controls response length
+        }
+        self.generation_params.update(generation_params or {})
+        self.limiter = get_limiter("gemini", **(rate_limit or {}))
+
+    def format_output(self, response, task):
+        # Ensure raw_output is always assigned
+        raw_output = response.text.strip() if hasattr(response, "text") and response.text else "No response generated."
+
+        # Extract only the letter if the task is multiple choice
+        if task in ["qa", "fib_closed"]:  
+            letter = extract_letter(raw_output)
+            if letter:
+                return letter  # Extracted letter (أ, ب, ج, د, هـ)
+            
+            logging.warning(f"[gemini] No option letter in MCQ answer: {raw_output[:80]!r}")
+            # Keep the raw output so the run can be re-scored later
+            return raw_output
+
+        # For other tasks, return the full generated response**
+        return raw_output
 
     def prompt(self, question, system_prompt, task=" "):
         """
@@ -22,32 +51,38 @@ class GeminiHandler:
         """
         try:
             full_prompt = f"{system_prompt}\n\n{question}"
-
-            response = self.client.generate_content(
-                contents=[full_prompt], 
-                generation_config={
-                "temperature": 1.0,  # More deterministic output
-                "max_output_tokens": 100  # optional: controls response length
-    }
+            response = self.limiter.call(
+                lambda: self.client.generate_content(
+                    contents=[full_prompt], 
+                    generation_config=self.generation_params
+                ),
+                estimated_tokens=estimate_tokens(
+                    full_prompt, max_tokens=self.generation_params.get("max_output_tokens")
+                )
             )
+            return self.format_output(response, task)
 
-            # Ensure raw_output is always assigned
-            raw_output = response.text.strip() if hasattr(response, "text") and response.text else "No response generated."
-
-            # Extract only the letter if the task is multiple choice
-            if task in ["qa", "fib_closed"]:  
-                match = re.search(r"\b([أبجد])\b", raw_output)
-                if match:
-                    return match.group(1)  # Extracted letter (أ, ب, ج, د)
-
-                print(f"Unexpected output from Gemini (MCQ mode)")  # Debugging
-                return "Invalid format"  # Fallback if no correct letter is found
-            
-            # For other tasks, return the full generated response**
-            return raw_output
+        except Exception as e:
+            log_request_failure("gemini", question, e)
+            return None
 
+    async def aprompt(self, question, system_prompt, task=" "):
+        """
+        Async version of `prompt` using the SDK's async generation call.
+        """
+        try:
+            full_prompt = f"{system_prompt}\n\n{question}"
+            response = await self.limiter.acall(
+                lambda: self.client.generate_content_async(
+                    contents=[full_prompt],
+                    generation_config=self.generation_params
+                ),
+                estimated_tokens=estimate_tokens(
+                    full_prompt, max_tokens=self.generation_params.get("max_output_tokens")
+                )
+            )
+            return self.format_output(response, task)
 
         except Exception as e:
-            print(f"Error occurred while processing the question: {question}")
-            print(f"Error details: {str(e)}")
+            log_request_failure("gemini", question, e)
             return None
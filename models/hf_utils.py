@@ -0,0 +1,34 @@
+import os
+
+# Hugging Face cache directory
+HF_HOME = "/scratch/ca2627/huggingface"
+
+_logged_in = False
+
+
+def set_hf_home():
+    """
+    Point HF_HOME at the shared cache. transformers and huggingface_hub read it
+    once, when they are first imported, so this must run before that import.
+    """
+    os.environ["HF_HOME"] = HF_HOME
+
+
+def login_to_hugging_face():
+    """
+    Log in with HF_TOKEN. Called when a Hugging Face handler is constructed
+    rather than at import time, so API-only runs need neither a token nor
+    huggingface_hub.
+    """
+    global _logged_in
+    set_hf_home()  # For callers that have not imported transformers yet
+    if _logged_in:
+        return
+
+    token = os.getenv("HF_TOKEN")
+    if not token:
+        raise ValueError("Hugging Face token not found. Please set HF_TOKEN environment variable.")
+
+    from huggingface_hub import login
+    login(token=token)
+    _logged_in = True
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import weakref
+import threading
+import importlib.util
+import httpx
+
+# Connection pool defaults. httpx keeps only 20 idle connections alive by
+# default, so concurrent runs above that would keep reconnecting; here every
+# pooled connection may stay alive.
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 600.0
+DEFAULT_KEEPALIVE_EXPIRY = 30.0
+
+
+class ConnectionStats:
+    """
+    Request and connection counters for one pooled client, fed by httpcore's
+    trace events: every request that did not open a TCP connection reused one.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.requests = 0
+        self.connections = 0
+        self.tls_handshakes = 0
+        self._lock = threading.Lock()
+
+    def trace(self, event_name, info):
+        if event_name in ("http11.send_request_headers.started", "http2.send_request_headers.started"):
+            with self._lock:
+                self.requests += 1
+        elif event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.connections += 1
+        elif event_name == "connection.start_tls.complete":
+            with self._lock:
+                self.tls_handshakes += 1
+
+    async def atrace(self, event_name, info):
+        self.trace(event_name, info)
+
+    @property
+    def reused(self):
+        return max(0, self.requests - self.connections)
+
+    def summary(self):
+        rate = self.reused / self.requests if self.requests else 0.0
+        return (
+            f"{self.name}: {self.requests} requests over {self.connections} connections "
+            f"({self.tls_handshakes} TLS handshakes, {rate:.1%} reused)"
+        )
+
+
+def client_settings(max_connections=DEFAULT_MAX_CONNECTIONS, max_keepalive_connections=None,
+                    keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                    read_timeout=DEFAULT_READ_TIMEOUT, http2=False):
+    """
+    httpx.Client keyword arguments for the `http` config section.
+    """
+    if http2 and importlib.util.find_spec("h2") is None:
+        logging.warning("http2 requested but the 'h2' package is not installed; using HTTP/1.1")
+        http2 = False
+    return {
+        "limits": httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections or max_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        "timeout": httpx.Timeout(read_timeout, connect=connect_timeout),
+        "http2": http2,
+    }
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def client_key(provider, base_url, settings):
+    """
+    Pool key: clients are shared per endpoint and `http` settings, so a handler
+    asking for other timeouts or limits gets its own client.
+    """
+    return provider, base_url, tuple(sorted(settings.items()))
+
+
+def get_http_client(provider, base_url=None, **settings):
+    """
+    Return the process-wide pooled httpx.Client for (`provider`, `base_url`)
+    and `settings` (see `client_settings`), creating it on first use, so every
+    handler and the judge talking to one endpoint share keep-alive connections.
+    """
+    key = client_key(provider, base_url, settings)
+    with _clients_lock:
+        if key not in _clients:
+            stats = ConnectionStats(f"{provider} ({base_url or 'default endpoint'})")
+
+            def add_trace(request):
+                request.extensions["trace"] = stats.trace
+
+            client = httpx.Client(event_hooks={"request": [add_trace]}, **client_settings(**settings))
+            _clients[key] = (client, stats)
+        return _clients[key][0]
+
+
+# Async clients hold connections bound to the event loop that opened them, so
+# they are pooled per running loop; one stats object covers all loops
+_async_clients = weakref.WeakKeyDictionary()
+_async_stats = {}
+
+
+def get_async_http_client(provider, base_url=None, **settings):
+    """
+    Async counterpart of `get_http_client`: the pooled httpx.AsyncClient for
+    (`provider`, `base_url`) and `settings` in the running event loop.
+    """
+    key = client_key(provider, base_url, settings)
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        if key not in clients:
+            stats = _async_stats.setdefault(
+                key, ConnectionStats(f"{provider} async ({base_url or 'default endpoint'})")
+            )
+
+            async def add_trace(request):
+                request.extensions["trace"] = stats.atrace
+
+            clients[key] = httpx.AsyncClient(event_hooks={"request": [add_trace]}, **client_settings(**settings))
+        return clients[key]
+
+
+def connection_stats():
+    """
+    ConnectionStats of every pooled client created so far.
+    """
+    with _clients_lock:
+        return [stats for _, stats in _clients.values()] + list(_async_stats.values())
+
+
+def log_connection_stats():
+    for stats in connection_stats():
+        if stats.requests:
+            logging.info(f"HTTP pool {stats.summary()}")
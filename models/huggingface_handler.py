@@ -1,24 +1,24 @@
 from transformers import AutoTokenizer, pipeline, AutoModelForCausalLM
 import os
-from huggingface_hub import login
 import re
+import logging
 import torch
+from models.model_handler_base import ModelHandlerBase
+from models.hf_utils import login_to_hugging_face
+from models.prefix_cache import PrefixKVCache, splits_cleanly
+from evaluations import answer_extraction
 
-# Set Hugging Face cache directory
-os.environ["HF_HOME"] = "/scratch/ca2627/huggingface"
+MCQ_TASKS = ["qa", "fib_closed"]
 
-os.environ["CUDA_LAUNCH_BLOCKING"] = "1"
-os.environ["TORCH_USE_CUDA_DSA"] = "1"
+# Option lines such as "أ. ..." or "هـ. ..."; the letter must start a word so that
+# word-final letters followed by a full stop are not mistaken for options
+OPTION_PATTERN = re.compile(r"(?<!\S)(?:[أبجد]|هـ?)\.\s*[^\n]+")
 
-# Login to Hugging Face
-token = os.getenv("HF_TOKEN")
-if token:
-    login(token=token)
-else:
-    raise ValueError("Hugging Face token not found. Please set HF_TOKEN environment variable.")
+class HuggingFaceHandler(ModelHandlerBase):
+    async_workers = 1  # One model, one generation at a time
+    extracts_answers = True
 
-class HuggingFaceHandler:
-    def __init__(self, model_name, cache_dir=None):
+    def __init__(self, model_name, cache_dir=None, generation_params=None, mcq_mode="generate", prefix_cache=False):
         """
         Initialize the Hugging Face handler with a configurable cache directory.
 
@@ -26,9 +26,25 @@ class HuggingFaceHandler:
             model_name (str): Name of the Hugging Face model.
             cache_dir (str): Directory to cache models and tokenizers.
             device (str): The device to use ("cpu" or "cuda").
+            generation_params (dict): Overrides for the sampling parameters.
+            mcq_mode (str): "generate" to sample an answer for qa/fib_closed, or
+                "logits" to score the option letters with a single forward pass.
+            prefix_cache (bool): Reuse the past key/values of the instruction block
+                across prompts instead of re-encoding it for every example.
         """        
+        # Login to Hugging Face
+        login_to_hugging_face()
+        os.environ["CUDA_LAUNCH_BLOCKING"] = "1"
+        os.environ["TORCH_USE_CUDA_DSA"] = "1"
+
         self.model_name = model_name
         self.cache_dir = cache_dir
+        self.mcq_mode = mcq_mode
+        self._letter_token_ids = {}
+        self.prefix_cache = prefix_cache
+        self._prefix_kv_cache = None
+        self.generation_params = {"temperature": 0.2, "top_p": 0.9, "do_sample": True}
+        self.generation_params.update(generation_params or {})
 
         self.model = AutoModelForCausalLM.from_pretrained(
             model_name,
@@ -68,69 +84,56 @@ class HuggingFaceHandler:
         )
         print("Using the text-generation pipeline.")
 
-    def prompt(self, input_text, instruction, task_type, max_tokens=256):
+    def get_prefix_cache(self, instruction, sample_prompt):
         """
-        Processes a question based on the task type and queries the model using the text-generation pipeline.
+        Return the key/value cache of the instruction block shared by all prompts,
+        building it on first use. Returns None when prefix caching is disabled, or
+        turns it off when `sample_prompt` does not tokenize as prefix + suffix.
         """
+        if not self.prefix_cache:
+            return None
+        # Both prompt templates start with the instruction followed by a blank line
+        prefix = f"{instruction}\n\n"
+        if self._prefix_kv_cache is None or self._prefix_kv_cache.prefix != prefix:
+            if not splits_cleanly(self.tokenizer, prefix, sample_prompt):
+                logging.warning(
+                    f"{self.model_name}: the tokenizer merges tokens across the end of the instruction; "
+                    "disabling the prefix cache"
+                )
+                self.prefix_cache = False
+                return None
+            self._prefix_kv_cache = PrefixKVCache(self.model, self.tokenizer, prefix)
+        return self._prefix_kv_cache
 
-        try:
-            # Test tokenization first
-            test_tokens = self.tokenizer.encode(input_text, return_tensors="pt")
-            print(f"Input tokens shape: {test_tokens.shape}")
-            print(f"Max token ID: {test_tokens.max().item()}")
-            print(f"Vocab size: {self.tokenizer.vocab_size}")
-            
-            # Check if any token IDs exceed vocab size
-            if test_tokens.max().item() >= self.tokenizer.vocab_size:
-                print("WARNING: Token ID exceeds vocabulary size!")
-                return "Tokenization error"
-            
-        except Exception as e:
-            print(f"Tokenization error: {e}")
-            return "Tokenization failed"
-    
-    
+    def build_prompt(self, input_text, instruction, task_type):
+        """
+        Format the model prompt for a dataset item.
+
+        Returns:
+            str: The prompt, or None if a multiple-choice item has no options.
+        """
         if task_type in ["fib_open", "aramed"]:
             # For open-ended fill-in-the-blank questions, extract the question without options
             question = input_text.strip()
     
             # Format the prompt to elicit an open-ended response
-            prompt = f"""{instruction}
+            return f"""{instruction}
 
 Question: "{question}"
 
 Answer:"""
-    
-            try:
-                response = self.pipeline(prompt, max_new_tokens=max_tokens, max_length=1024, num_return_sequences=1, temperature=0.2, top_p=0.9, do_sample=True)
 
-                generated_text = response[0]["generated_text"].strip()
+        # Default to handling multiple-choice questions (for qa and fib_closed)
+        options = OPTION_PATTERN.findall(input_text)
+        #options = re.findall(r"[ABCD]\.\s*[^\n]+", input_text)
 
-                # Ensure extraction only grabs the assistant's response
-                if "Answer:" in generated_text:
-                    final_answer = generated_text.split("Answer:")[-1].strip()
-                else:
-                    # If unexpected format, return as is
-                    final_answer = generated_text
-            
-                return final_answer
+        if not options:
+            print("No options found in the input text.")
+            return None
 
-            except Exception as e:
-                print(f"Error occurred while processing the input: {input_text}")
-                print(f"Error details: {str(e)}")
-                return None
+        question = input_text.split(options[0])[0].strip()
 
-        else:  # Default to handling multiple-choice questions (for qa and fib_closed)
-            options = re.findall(r"[أبجد]\.\s*[^\n]+", input_text)
-            #options = re.findall(r"[ABCD]\.\s*[^\n]+", input_text)
-    
-            if not options:
-                print("No options found in the input text.")
-                return "Invalid input format."
-    
-            question = input_text.split(options[0])[0].strip()
-    
-            prompt = f"""{instruction}
+        return f"""{instruction}
 
     
     Question: {question}
@@ -138,64 +141,246 @@ Answer:"""
     Options:
     {chr(10).join(options)}
     A: """
+
+    def extract_answer(self, generated_text, task_type):
+        """
+        Post-process generated text into the final prediction.
+        """
+        generated_text = generated_text.strip()
+
+        if task_type in ["fib_open", "aramed"]:
+            # Ensure extraction only grabs the assistant's response
+            if "Answer:" in generated_text:
+                return generated_text.split("Answer:")[-1].strip()
+            # If unexpected format, return as is
+            return generated_text
+
+        # The answer follows the last "A:" (earlier ones belong to few-shot examples)
+        extraction = answer_extraction.extract_answer(generated_text)
+        if extraction.letter:
+            print(f"Pattern matched ({extraction.strategy}): {extraction.letter}")
+            return extraction.letter
+        # Keep the raw output so the run can be re-scored later
+        print("No pattern matched")
+        return generated_text
+
+    def prompt(self, input_text, instruction, task_type, max_tokens=256):
+        """
+        Processes a question based on the task type and queries the model using the text-generation pipeline.
+        """
+
+        try:
+            # Test tokenization first
+            test_tokens = self.tokenizer.encode(input_text, return_tensors="pt")
+            print(f"Input tokens shape: {test_tokens.shape}")
+            print(f"Max token ID: {test_tokens.max().item()}")
+            print(f"Vocab size: {self.tokenizer.vocab_size}")
+            
+            # Check if any token IDs exceed vocab size
+            if test_tokens.max().item() >= self.tokenizer.vocab_size:
+                print("WARNING: Token ID exceeds vocabulary size!")
+                return "Tokenization error"
+            
+        except Exception as e:
+            print(f"Tokenization error: {e}")
+            return "Tokenization failed"
+
+        if self.mcq_mode == "logits" and task_type in MCQ_TASKS:
+            return self.score_options_batch([input_text], instruction)[0]["prediction"]
+
+        if self.prefix_cache:
+            # The pipeline cannot take precomputed key/values; use the batched path
+            return self.prompt_batch([input_text], instruction, task_type, max_tokens=max_tokens, batch_size=1)[0]
     
-            try:
+        prompt = self.build_prompt(input_text, instruction, task_type)
+        if prompt is None:
+            return "Invalid input format."
+
+        try:
+            if task_type in ["fib_open", "aramed"]:
+                response = self.pipeline(prompt, max_new_tokens=max_tokens, max_length=1024, num_return_sequences=1, **self.generation_params)
+            else:
                 # Clear CUDA cache before generation
                 torch.cuda.empty_cache()
-                
+
                 # Generate with more conservative parameters
                 response = self.pipeline(
                     prompt, 
                     max_new_tokens=min(max_tokens, 50),  # Limit to prevent memory issues
                     max_length=None,  # Don't set both max_length and max_new_tokens
                     num_return_sequences=1, 
-                    temperature=0.2, 
-                    top_p=0.9, 
-                    do_sample=True,
+                    **self.generation_params,
                     pad_token_id=self.tokenizer.pad_token_id,
                     eos_token_id=self.tokenizer.eos_token_id,
                     return_full_text=False,  # Only return generated part
                     clean_up_tokenization_spaces=True
                 )
-    
-                generated_text = response[0]["generated_text"].strip()
-                
-                
-                # Extract only the letter after "A:" - handle newlines and spaces
-                # Find the LAST occurrence of "A:" to avoid matching examples
-                last_a_pos = generated_text.rfind("A:")
-                if last_a_pos != -1:
-                    # Look for pattern only after the last "A:"
-                    after_last_a = generated_text[last_a_pos:]
-                    pattern = r"A:\s*\n?\s*[\"']?([أبجد])"
-                    match = re.search(pattern, after_last_a)
-                    if match:
-                        final_answer = match.group(1)
-                        print(f"Pattern matched: {final_answer}")
-                    else:
-                        # Fallback: look for any Arabic letter at the very end
-                        end_pattern = r"([أبجد])'?\s*$"
-                        end_match = re.search(end_pattern, generated_text)
-                        if end_match:
-                            final_answer = end_match.group(1)
-                            print(f"End pattern matched: {final_answer}")
-                        else:
-                            final_answer = generated_text
-                            print("No pattern matched")
+
+            return self.extract_answer(response[0]["generated_text"], task_type)
+
+        except Exception as e:
+            print(f"Error occurred while processing the input: {input_text}")
+            print(f"Error details: {str(e)}")
+            return None
+
+    def prompt_batch(self, inputs, instruction, task_type, max_tokens=256, batch_size=8):
+        """
+        Generate predictions for many inputs with batched `generate` calls.
+
+        Prompts are sorted by token length and split into batches of `batch_size`,
+        so each left-padded batch holds prompts of similar length. Results are
+        returned in the order of `inputs`.
+
+        Args:
+            inputs (list of str): Dataset questions.
+            instruction (str): Instruction text prepended to every prompt.
+            task_type (str): Task type from the config.
+            max_tokens (int): Maximum number of new tokens per prompt.
+            batch_size (int): Number of prompts per `generate` call.
+        Returns:
+            list: One prediction per input (None for failed batches).
+        """
+        if self.mcq_mode == "logits" and task_type in MCQ_TASKS:
+            results = self.score_options_batch(inputs, instruction, batch_size=batch_size)
+            return [result["prediction"] for result in results]
+
+        predictions = [None] * len(inputs)
+        prompts = {}
+        for i, input_text in enumerate(inputs):
+            prompt = self.build_prompt(input_text, instruction, task_type)
+            if prompt is None:
+                predictions[i] = "Invalid input format."
+            else:
+                prompts[i] = prompt
+
+        if task_type not in ["fib_open", "aramed"]:
+            max_tokens = min(max_tokens, 50)  # Same limit as the single-prompt path
+
+        # Length bucketing: neighbouring prompts in this order need little padding
+        lengths = {i: len(self.tokenizer.encode(prompt)) for i, prompt in prompts.items()}
+        order = sorted(prompts, key=lambda i: lengths[i])
+
+        prefix_cache = self.get_prefix_cache(instruction, prompts[order[0]]) if order else None
+
+        for start in range(0, len(order), batch_size):
+            batch_ids = order[start:start + batch_size]
+            batch_prompts = [prompts[i] for i in batch_ids]
+            generate_kwargs = dict(
+                max_new_tokens=max_tokens,
+                **self.generation_params,
+                pad_token_id=self.tokenizer.pad_token_id,
+                eos_token_id=self.tokenizer.eos_token_id
+            )
+            try:
+                if prefix_cache is not None and all(prefix_cache.matches(p) for p in batch_prompts):
+                    new_tokens = prefix_cache.generate(batch_prompts, **generate_kwargs)
                 else:
-                    # Fallback if no "A:" found
-                    end_pattern = r"([أبجد])'?\s*$"
-                    end_match = re.search(end_pattern, generated_text)
-                    if end_match:
-                        final_answer = end_match.group(1)
-                        print(f"End pattern matched: {final_answer}")
-                    else:
-                        final_answer = generated_text
-                        print("No A: found")
-    
-                return final_answer
-    
+                    encoded = self.tokenizer(
+                        batch_prompts,
+                        return_tensors="pt",
+                        padding=True
+                    ).to(self.model.device)
+                    with torch.no_grad():
+                        outputs = self.model.generate(**encoded, **generate_kwargs)
+                    # With left padding every prompt ends at the same position
+                    new_tokens = outputs[:, encoded["input_ids"].shape[1]:]
+                generated = self.tokenizer.batch_decode(
+                    new_tokens,
+                    skip_special_tokens=True,
+                    clean_up_tokenization_spaces=True
+                )
+                for i, text in zip(batch_ids, generated):
+                    predictions[i] = self.extract_answer(text, task_type)
             except Exception as e:
-                print(f"Error occurred while processing the input: {input_text}")
+                print(f"Error occurred while processing a batch of {len(batch_ids)} inputs")
                 print(f"Error details: {str(e)}")
-                return None
\ No newline at end of file
+                torch.cuda.empty_cache()
+
+        return predictions
+
+    def option_token_ids(self, letter):
+        """
+        Token ids that can start the answer `letter`, with and without a leading space.
+        """
+        if letter not in self._letter_token_ids:
+            variants = ["ه", "هـ"] if letter == "هـ" else [letter]
+            ids = set()
+            for variant in variants:
+                for text in (variant, " " + variant):
+                    tokens = self.tokenizer.encode(text, add_special_tokens=False)
+                    # Skip tokens that only carry the leading space
+                    tokens = [t for t in tokens if self.tokenizer.decode([t]).strip()]
+                    if tokens:
+                        ids.add(tokens[0])
+            self._letter_token_ids[letter] = sorted(ids)
+        return self._letter_token_ids[letter]
+
+    def score_options_batch(self, inputs, instruction, batch_size=8):
+        """
+        Score multiple-choice options with one forward pass per batch.
+
+        The next-token distribution after the prompt is restricted to the option
+        letters present in each question and renormalised, so the prediction is the
+        most likely letter and no tokens are sampled.
+
+        Args:
+            inputs (list of str): Multiple-choice questions with their options.
+            instruction (str): Instruction text prepended to every prompt.
+            batch_size (int): Number of prompts per forward pass.
+        Returns:
+            list of dict: `prediction` (letter) and `probabilities` (letter -> probability) per input.
+        """
+        results = [None] * len(inputs)
+        prompts, letters = {}, {}
+        for i, input_text in enumerate(inputs):
+            prompt = self.build_prompt(input_text, instruction, "qa")
+            if prompt is None:
+                results[i] = {"prediction": "Invalid input format.", "probabilities": {}}
+                continue
+            # The answer letter may be tokenized with its leading space
+            prompts[i] = prompt.rstrip()
+            letters[i] = ["هـ" if option[0] == "ه" else option[0] for option in OPTION_PATTERN.findall(input_text)]
+
+        # Length bucketing, as in prompt_batch
+        lengths = {i: len(self.tokenizer.encode(prompt)) for i, prompt in prompts.items()}
+        order = sorted(prompts, key=lambda i: lengths[i])
+
+        prefix_cache = self.get_prefix_cache(instruction, prompts[order[0]]) if order else None
+
+        for start in range(0, len(order), batch_size):
+            batch_ids = order[start:start + batch_size]
+            batch_prompts = [prompts[i] for i in batch_ids]
+            try:
+                if prefix_cache is not None and all(prefix_cache.matches(p) for p in batch_prompts):
+                    logits = prefix_cache.last_token_logits(batch_prompts)
+                else:
+                    encoded = self.tokenizer(
+                        batch_prompts,
+                        return_tensors="pt",
+                        padding=True
+                    ).to(self.model.device)
+                    # Left padding shifts positions, so derive them from the attention mask
+                    position_ids = (encoded["attention_mask"].cumsum(-1) - 1).clamp(min=0)
+                    with torch.no_grad():
+                        logits = self.model(**encoded, position_ids=position_ids).logits[:, -1, :]
+                log_probs = torch.log_softmax(logits.float(), dim=-1)
+
+                for row, i in enumerate(batch_ids):
+                    letter_scores = torch.stack([
+                        torch.logsumexp(log_probs[row, self.option_token_ids(letter)], dim=0)
+                        for letter in letters[i]
+                    ])
+                    probabilities = torch.softmax(letter_scores, dim=0).tolist()
+                    distribution = dict(zip(letters[i], probabilities))
+                    results[i] = {
+                        "prediction": max(distribution, key=distribution.get),
+                        "probabilities": distribution
+                    }
+            except Exception as e:
+                print(f"Error occurred while scoring a batch of {len(batch_ids)} inputs")
+                print(f"Error details: {str(e)}")
+                torch.cuda.empty_cache()
+                for i in batch_ids:
+                    results[i] = {"prediction": None, "probabilities": {}}
+
+        return results
@@ -1,33 +1,37 @@
 from transformers import AutoTokenizer, pipeline, AutoModelForCausalLM
 import os
-from huggingface_hub import login
 import re
+import logging
 import torch
+from models.model_handler_base import ModelHandlerBase
+from models.hf_utils import login_to_hugging_face
+from models.prefix_cache import PrefixKVCache, splits_cleanly
+from evaluations.answer_extraction import extract_letter
 
-# Set Hugging Face cache directory
-os.environ["HF_HOME"] = "/scratch/ca2627/huggingface"
-os.environ["CUDA_LAUNCH_BLOCKING"] = "1"
-os.environ["TORCH_USE_CUDA_DSA"] = "1"
-os.environ["PYTORCH_CUDA_ALLOC_CONF"] = "expandable_segments:True"
+class medgemma(ModelHandlerBase):
+    async_workers = 1  # One model, one generation at a time
+    extracts_answers = True
 
-# Login to Hugging Face
-token = os.getenv("HF_TOKEN")
-if token:
-    login(token=token)
-else:
-    raise ValueError("Hugging Face token not found. Please set HF_TOKEN environment variable.")
-
-class medgemma:
-    def __init__(self, model_name, cache_dir=None):
+    def __init__(self, model_name, cache_dir=None, prefix_cache=False):
         """
         Initialize the Hugging Face handler with a configurable cache directory.
 
         Args:
             model_name (str): Name of the Hugging Face model.
             cache_dir (str): Directory to cache models and tokenizers.
+            prefix_cache (bool): Reuse the past key/values of the system prompt
+                across prompts instead of re-encoding it for every example.
         """        
+        # Login to Hugging Face
+        login_to_hugging_face()
+        os.environ["CUDA_LAUNCH_BLOCKING"] = "1"
+        os.environ["TORCH_USE_CUDA_DSA"] = "1"
+        os.environ["PYTORCH_CUDA_ALLOC_CONF"] = "expandable_segments:True"
+
         self.model_name = model_name
         self.cache_dir = cache_dir
+        self.prefix_cache = prefix_cache
+        self._prefix_kv_caches = {}
 
         # Clear any existing GPU memory before loading
         torch.cuda.empty_cache()
@@ -112,6 +116,54 @@ class medgemma:
         )
         print("Using the text-generation pipeline.")
 
+    def get_prefix_cache(self, system_prompt, sample_rendered):
+        """
+        Return the key/value cache of the chat-template text that precedes the
+        user message for `system_prompt`, building it on first use. Returns None
+        when `sample_rendered` does not tokenize as prefix + user message.
+        """
+        if system_prompt not in self._prefix_kv_caches:
+            sentinel = "\u0000"
+            rendered = self.tokenizer.apply_chat_template(
+                [{"role": "system", "content": system_prompt}, {"role": "user", "content": sentinel}],
+                tokenize=False,
+                add_generation_prompt=True
+            )
+            prefix = rendered.split(sentinel)[0]
+            # The rendered template already contains the BOS token
+            if sample_rendered.startswith(prefix) and splits_cleanly(
+                self.tokenizer, prefix, sample_rendered, add_special_tokens=False
+            ):
+                self._prefix_kv_caches[system_prompt] = PrefixKVCache(
+                    self.model, self.tokenizer, prefix, add_special_tokens=False
+                )
+            else:
+                logging.warning(
+                    f"{self.model_name}: the system prompt does not tokenize separately from the user message; "
+                    "not caching it"
+                )
+                self._prefix_kv_caches[system_prompt] = None
+        return self._prefix_kv_caches[system_prompt]
+
+    def chat(self, messages, **generate_kwargs):
+        """
+        Generate the assistant reply to `messages` and return its text.
+        Uses the text-generation pipeline, or the cached system-prompt prefix
+        when prefix caching is enabled.
+        """
+        prefix_cache = None
+        if self.prefix_cache:
+            rendered = self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+            prefix_cache = self.get_prefix_cache(messages[0]["content"], rendered)
+        if prefix_cache is None or not prefix_cache.matches(rendered):
+            response = self.pipeline(messages, **generate_kwargs)
+            return response[0]["generated_text"][-1]["content"].strip()
+
+        generate_kwargs.pop("num_return_sequences", None)
+        generate_kwargs.setdefault("pad_token_id", self.tokenizer.pad_token_id)
+        new_tokens = prefix_cache.generate([rendered], **generate_kwargs)
+        return self.tokenizer.decode(new_tokens[0], skip_special_tokens=True).strip()
+
     def cpu_fallback_generation(self, messages, max_tokens):
         """
         Simple fallback that returns a placeholder instead of loading CPU model
@@ -163,7 +215,7 @@ class medgemma:
                 print("Starting GPU generation...")
                 
                 # Use chat format instead of raw prompt
-                response = self.pipeline(
+                generated_text = self.chat(
                     messages, 
                     max_new_tokens=min(max_tokens, 150),
                     num_return_sequences=1, 
@@ -174,9 +226,6 @@ class medgemma:
 
                 print("GPU generation completed!")
                 
-                # Extract from chat response format
-                generated_text = response[0]["generated_text"][-1]["content"].strip()
-                
                 # Clear memory after generation
                 torch.cuda.empty_cache()
                 
@@ -277,7 +326,7 @@ class medgemma:
                 torch.cuda.empty_cache()
                 
                 # Use chat format with conservative parameters
-                response = self.pipeline(
+                generated_text = self.chat(
                     messages, 
                     max_new_tokens=10,
                     num_return_sequences=1, 
@@ -286,14 +335,11 @@ class medgemma:
                     pad_token_id=self.tokenizer.pad_token_id,
                     eos_token_id=self.tokenizer.eos_token_id
                 )
-    
-                # Extract from chat response format
-                generated_text = response[0]["generated_text"][-1]["content"].strip()
                 
-                # Look for Arabic letters directly
-                arabic_letter_match = re.search(r'([أبجدهو])', generated_text)
-                if arabic_letter_match:
-                    final_answer = arabic_letter_match.group(1)
+                # Look for the option letter in the reply
+                letter = extract_letter(generated_text)
+                if letter:
+                    final_answer = letter
                     print(f"Extracted letter: {final_answer}")
                 else:
                     final_answer = generated_text
@@ -314,11 +360,7 @@ class medgemma:
                             do_sample=False
                         )
                         generated_text = response[0]["generated_text"][-1]["content"].strip()
-                        arabic_letter_match = re.search(r'([أبجدهو])', generated_text)
-                        if arabic_letter_match:
-                            final_answer = arabic_letter_match.group(1)
-                        else:
-                            final_answer = generated_text
+                        final_answer = extract_letter(generated_text) or generated_text
                         torch.cuda.empty_cache()
                         return final_answer
                     except Exception as retry_e:
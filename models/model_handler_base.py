@@ -1,11 +1,66 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
 class ModelHandlerBase:
     """
     Abstract base class for model handlers.
-    All model handlers must implement the `prompt` method.
+    All model handlers must implement the `prompt` method. API handlers also
+    implement `aprompt` natively with their async clients; for everything else
+    the default `aprompt` runs `prompt` in a thread pool.
     """
-    def prompt(self, input_text, **kwargs):
+    # Maximum number of concurrent `prompt` calls run by the default `aprompt`.
+    # Local models set this to 1 so a single GPU model is never driven by
+    # several threads at once; None uses the event loop's default executor.
+    async_workers = None
+    # Handlers that reduce MCQ outputs with `evaluations.answer_extraction`
+    # return extracted letters, so their cached responses depend on that code.
+    extracts_answers = False
+
+    def prompt(self, input_text, instruction, task_type=" ", **kwargs):
         """
         Generate a response from the model.
 
         """
         raise NotImplementedError("Subclasses must implement the `prompt` method.")
+
+    def _prompt_executor(self):
+        if self.async_workers is None:
+            return None
+        if getattr(self, "_async_executor", None) is None:
+            self._async_executor = ThreadPoolExecutor(max_workers=self.async_workers)
+        return self._async_executor
+
+    async def aprompt(self, input_text, instruction, task_type=" ", **kwargs):
+        """
+        Async version of `prompt`.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._prompt_executor(),
+            functools.partial(self.prompt, input_text, instruction, task_type, **kwargs)
+        )
+
+    async def aprompt_batch(self, inputs, instruction, task_type=" ", max_concurrency=None, **kwargs):
+        """
+        Generate responses for many inputs, returned in input order.
+        Handlers with a synchronous `prompt_batch` (local models) run it as one
+        call in the executor; otherwise up to `max_concurrency` `aprompt` calls
+        are in flight at once.
+        """
+        if hasattr(self, "prompt_batch"):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._prompt_executor(),
+                functools.partial(self.prompt_batch, inputs, instruction, task_type, **kwargs)
+            )
+
+        kwargs.pop("batch_size", None)
+        semaphore = asyncio.Semaphore(max_concurrency or len(inputs) or 1)
+
+        async def bounded(input_text):
+            async with semaphore:
+                return await self.aprompt(input_text, instruction, task_type, **kwargs)
+
+        return list(await asyncio.gather(*(bounded(input_text) for input_text in inputs)))
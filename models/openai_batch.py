@@ -0,0 +1,88 @@
+import json
+import time
+import logging
+
+# Batch states after which polling stops
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+class OpenAIBatchMixin:
+    """
+    Offline batch submission for handlers built on the OpenAI client
+    (`self.client`, `self.model`, `self.generation_params`).
+
+    The whole dataset is written to a JSONL batch request file, uploaded and
+    submitted to the `/v1/batches` endpoint, polled until done, and the results
+    are mapped back to dataset ids through each request's `custom_id`.
+    """
+    def build_batch_request(self, item_id, question, instruction):
+        return {
+            "custom_id": str(item_id),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": self.model,
+                "messages": [
+                    {"role": "system", "content": instruction},
+                    {"role": "user", "content": question}
+                ],
+                **self.generation_params
+            }
+        }
+
+    def submit_batch(self, items, instruction, batch_path, poll_interval=30, completion_window="24h"):
+        """
+        Run all items through the provider's batch API.
+        Args:
+            items (list of dict): Work items with `id` and `input` keys.
+            instruction (str): System prompt for every request.
+            batch_path (str): Where to write the JSONL batch request file.
+            poll_interval (float): Seconds between status checks.
+            completion_window (str): Batch completion window requested from the provider.
+        Returns:
+            dict: id -> prediction text; ids whose request failed map to None.
+        """
+        with open(batch_path, 'w', encoding='utf-8') as f:
+            for item in items:
+                request = self.build_batch_request(item["id"], item["input"], instruction)
+                f.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+        with open(batch_path, 'rb') as f:
+            upload = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=upload.id,
+            endpoint="/v1/chat/completions",
+            completion_window=completion_window
+        )
+        logging.info(f"Submitted batch {batch.id} with {len(items)} requests from {batch_path}")
+
+        while batch.status not in TERMINAL_STATUSES:
+            time.sleep(poll_interval)
+            batch = self.client.batches.retrieve(batch.id)
+            counts = batch.request_counts
+            if counts is not None:
+                logging.info(
+                    f"Batch {batch.id}: {batch.status}, "
+                    f"{counts.completed}/{counts.total} completed, {counts.failed} failed"
+                )
+
+        if batch.status != "completed":
+            raise RuntimeError(f"Batch {batch.id} ended with status {batch.status}")
+
+        predictions = {item["id"]: None for item in items}
+        if batch.output_file_id:
+            output = self.client.files.content(batch.output_file_id).text
+            for line in output.splitlines():
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                response = result.get("response") or {}
+                if response.get("status_code") != 200:
+                    continue
+                content = response["body"]["choices"][0]["message"]["content"]
+                predictions[int(result["custom_id"])] = content.strip()
+
+        failed = sum(prediction is None for prediction in predictions.values())
+        if failed:
+            logging.warning(f"Batch {batch.id}: {failed} requests returned no prediction")
+        return predictions
@@ -1,37 +1,38 @@
-from openai import OpenAI
-import re
+from openai import OpenAI, AsyncOpenAI
+import asyncio
+from models.model_handler_base import ModelHandlerBase
+from models.rate_limit import get_limiter, estimate_tokens, log_request_failure
+from models.openai_batch import OpenAIBatchMixin
+from models.http_clients import get_http_client, get_async_http_client
 
-def extract_letter_from_text(text):
-    """
-    Extract a single Arabic MCQ letter from model-generated output.
-    Handles formats like:
-    - "الإجابة الصحيحة هي: ب"
-    - "Correct letter: ب"
-    - "ب"
-    """
-    if not text:
-        return None
-
-    text = text.strip()
-    text = re.sub(r"(الإجابة\s*(الصحيحة)?\s*(هي)?\s*[:：]?)", "", text)
-    text = re.sub(r"(الجواب\s*(الصحيح)?\s*(هو)?\s*[:：]?)", "", text)
-    text = text.strip()
-
-    match = re.search(r"([أبجدهـه])", text)
-    if match:
-        letter = match.group(1)
-        return 'هـ' if letter in {'ه', 'هـ'} else letter
-
-    return None
-
-
-class OpenAIHandler:
-    def __init__(self, api_key, model="gpt-4-0613"):
+class OpenAIHandler(OpenAIBatchMixin, ModelHandlerBase):
+    def __init__(self, api_key, model="gpt-4-0613", generation_params=None, base_url=None, rate_limit=None,
+                 http=None):
         """
         Initialize the OpenAI handler.
+        Retries and rate limiting are handled by the shared "openai" limiter,
+        so the SDK's own retries are disabled. Connections come from the shared
+        pool for this endpoint, configured by `http`.
         """
-        self.client = OpenAI(api_key=api_key)  # Use the OpenAI client
+        self.client = OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=0,
+            http_client=get_http_client("openai", base_url, **(http or {}))
+        )  # Use the OpenAI client
+        self.base_url = base_url
+        self.http = http or {}
+        self._async_client = None
         self.model = model
+        self.limiter = get_limiter("openai", **(rate_limit or {}))
+        self.generation_params = {
+            "temperature": 1.0,  # Configure response randomness
+            "max_tokens": 1000,
+            "top_p": 1.0,        # Nucleus sampling
+            "frequency_penalty": 0.0,  # Penalize repetition
+            "presence_penalty": 0.0    # Encourage new topics
+        }
+        self.generation_params.update(generation_params or {})
 
     def prompt(self, question, instruction, task_type=" "):
         """
@@ -40,26 +41,64 @@ class OpenAIHandler:
         system_prompt = instruction
         try:
             # Create a chat completion using the OpenAI client
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": question}
-                ],
-                temperature=1.0,  # Configure response randomness
-                max_tokens=1000,
-                top_p=1.0,        # Nucleus sampling
-                frequency_penalty=0.0,  # Penalize repetition
-                presence_penalty=0.0    # Encourage new topics
+            response = self.limiter.call(
+                lambda: self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": question}
+                    ],
+                    **self.generation_params
+                ),
+                estimated_tokens=estimate_tokens(
+                    system_prompt, question, max_tokens=self.generation_params.get("max_tokens")
+                )
             )
 
             # Extract the message content from the response
             raw_output = response.choices[0].message.content.strip()
             return raw_output
-            #return extract_letter_from_text(raw_output)
 
         except Exception as e:
-            # Handle exceptions and log errors
-            print(f"Error occurred while processing the question: {question}")
-            print(f"Error details: {str(e)}")
+            # None marks the item as failed; `--resume` retries it
+            log_request_failure("openai", question, e)
+            return None
+
+    def get_async_client(self):
+        """
+        AsyncOpenAI client for the running event loop; async connections cannot
+        be shared between loops.
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client[0] is not loop:
+            self._async_client = (loop, AsyncOpenAI(
+                api_key=self.client.api_key,
+                base_url=self.base_url,
+                max_retries=0,
+                http_client=get_async_http_client("openai", self.base_url, **self.http)
+            ))
+        return self._async_client[1]
+
+    async def aprompt(self, question, instruction, task_type=" "):
+        """
+        Async version of `prompt` using the AsyncOpenAI client.
+        """
+        try:
+            client = self.get_async_client()
+            response = await self.limiter.acall(
+                lambda: client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": instruction},
+                        {"role": "user", "content": question}
+                    ],
+                    **self.generation_params
+                ),
+                estimated_tokens=estimate_tokens(
+                    instruction, question, max_tokens=self.generation_params.get("max_tokens")
+                )
+            )
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            log_request_failure("openai", question, e)
             return None
@@ -0,0 +1,127 @@
+import copy
+import torch
+
+
+def splits_cleanly(tokenizer, prefix, prompt, add_special_tokens=True):
+    """
+    Whether `prompt` tokenizes to the tokens of `prefix` followed by the tokens
+    of the rest of the prompt. Tokenizers may merge characters across the
+    boundary (e.g. the blank line ending the instruction and the question's
+    first character), in which case a cached prefix would feed the model a
+    different token sequence than the uncached prompt.
+    """
+    whole = tokenizer(prompt, add_special_tokens=add_special_tokens)["input_ids"]
+    head = tokenizer(prefix, add_special_tokens=add_special_tokens)["input_ids"]
+    tail = tokenizer(prompt[len(prefix):], add_special_tokens=False)["input_ids"]
+    return list(whole) == list(head) + list(tail)
+
+
+class PrefixKVCache:
+    """
+    Past key/values for a fixed prompt prefix (e.g. the instruction block),
+    computed once and reused for every prompt that starts with it.
+
+    Prompts are encoded as the cached prefix tokens followed by the separately
+    tokenized, left-padded suffixes. The padding therefore sits between prefix
+    and suffix; it is masked out and positions are derived from the attention
+    mask, so every suffix continues right after the prefix. Callers check
+    `splits_cleanly` on a sample prompt before building one.
+    """
+    def __init__(self, model, tokenizer, prefix, add_special_tokens=True):
+        """
+        Args:
+            model: Causal LM used for generation.
+            tokenizer: Matching tokenizer (left padding).
+            prefix (str): Text shared by all prompts.
+            add_special_tokens (bool): Whether the prefix starts with the tokenizer's
+                special tokens (False for text rendered by a chat template).
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefix = prefix
+        self.prefix_ids = tokenizer(
+            prefix, return_tensors="pt", add_special_tokens=add_special_tokens
+        )["input_ids"].to(model.device)
+        with torch.no_grad():
+            self.past_key_values = model(self.prefix_ids, use_cache=True).past_key_values
+
+    @property
+    def prefix_length(self):
+        return self.prefix_ids.shape[1]
+
+    def matches(self, prompt):
+        return prompt.startswith(self.prefix)
+
+    def expanded_cache(self, batch_size):
+        """
+        A fresh copy of the prefix cache repeated along the batch dimension.
+        """
+        if hasattr(self.past_key_values, "batch_repeat_interleave"):
+            # transformers Cache object: generate() mutates it in place
+            cache = copy.deepcopy(self.past_key_values)
+            cache.batch_repeat_interleave(batch_size)
+            return cache
+        # Legacy tuple-of-tuples format
+        return tuple(
+            tuple(tensor.expand(batch_size, *tensor.shape[1:]).contiguous() for tensor in layer)
+            for layer in self.past_key_values
+        )
+
+    def encode(self, prompts):
+        """
+        Tokenize prompts as prefix ids + left-padded suffix ids.
+        Returns:
+            tuple: (input_ids, attention_mask) covering prefix and suffix.
+        """
+        suffixes = [prompt[len(self.prefix):] for prompt in prompts]
+        encoded = self.tokenizer(
+            suffixes, return_tensors="pt", padding=True, add_special_tokens=False
+        ).to(self.model.device)
+        batch_size = len(prompts)
+        input_ids = torch.cat(
+            [self.prefix_ids.expand(batch_size, -1), encoded["input_ids"]], dim=1
+        )
+        attention_mask = torch.cat(
+            [
+                torch.ones(
+                    (batch_size, self.prefix_length),
+                    dtype=encoded["attention_mask"].dtype,
+                    device=self.model.device,
+                ),
+                encoded["attention_mask"],
+            ],
+            dim=1,
+        )
+        return input_ids, attention_mask
+
+    def generate(self, prompts, **generate_kwargs):
+        """
+        Generate continuations, prefilling only the suffix tokens.
+        Returns:
+            torch.Tensor: The newly generated token ids, one row per prompt.
+        """
+        input_ids, attention_mask = self.encode(prompts)
+        with torch.no_grad():
+            outputs = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                past_key_values=self.expanded_cache(len(prompts)),
+                **generate_kwargs
+            )
+        return outputs[:, input_ids.shape[1]:]
+
+    def last_token_logits(self, prompts):
+        """
+        Next-token logits after each prompt from a single forward pass over the suffixes.
+        """
+        input_ids, attention_mask = self.encode(prompts)
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=input_ids[:, self.prefix_length:],
+                attention_mask=attention_mask,
+                position_ids=position_ids[:, self.prefix_length:],
+                past_key_values=self.expanded_cache(len(prompts)),
+                use_cache=True,
+            )
+        return outputs.logits[:, -1, :]
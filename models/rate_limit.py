@@ -0,0 +1,316 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+import collections
+from email.utils import parsedate_to_datetime
+
+# HTTP statuses worth retrying: timeouts, conflicts, throttling, server errors and
+# Anthropic's "overloaded" (529)
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504, 529}
+THROTTLE_STATUSES = {429, 529}
+
+
+def status_code(error):
+    """
+    HTTP status of an SDK exception (OpenAI, Anthropic and google.api_core all
+    expose it under one of these names), or None for transport errors.
+    """
+    for attribute in ("status_code", "code", "http_status"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def is_retryable(error):
+    status = status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    # No status: connection resets and timeouts
+    name = type(error).__name__.lower()
+    return "timeout" in name or "connection" in name
+
+
+def retry_after(error):
+    """
+    Seconds to wait according to the Retry-After / retry-after-ms response headers.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def log_request_failure(provider, question, error):
+    """
+    Log a request that failed for good (retries exhausted or not retryable).
+    Handlers then return None, which marks the item as failed so that
+    `run_experiment --resume` retries it.
+    """
+    preview = " ".join((question or "").split())[:80]
+    logging.error(
+        f"[{provider}] Request failed: {type(error).__name__} (status {status_code(error)}): {error} "
+        f"(question: {preview!r})"
+    )
+
+
+def estimate_tokens(*texts, max_tokens=0):
+    """
+    Rough token count of a request for tokens-per-minute budgeting: prompt
+    characters / 3 (conservative for Arabic) plus the completion budget, which
+    providers count against the limit up front.
+    """
+    return sum(len(text or "") for text in texts) // 3 + (max_tokens or 0)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `rate_per_minute`.
+    `reserve` always succeeds and returns how long the caller must wait, so the
+    same bucket serves threads and event loops.
+    """
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity
+        self.rate = self.capacity / 60.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount=1):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Requests larger than the bucket would never fit; cap them at its size
+            self.tokens -= min(float(amount), self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on in-flight requests: halve the limit when the provider throttles,
+    raise it by one after a full window of successful requests.
+    Threads block in `acquire`; coroutines await `aacquire`, which parks them on
+    a future that is resolved when a slot frees up.
+    """
+    def __init__(self, maximum, minimum=1):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = maximum
+        self.in_flight = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+        self._async_waiters = collections.deque()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def try_acquire(self):
+        """
+        Non-blocking `acquire`; True if a slot was taken.
+        """
+        with self._condition:
+            if self.in_flight >= self.limit:
+                return False
+            self.in_flight += 1
+            return True
+
+    async def aacquire(self):
+        """
+        Async `acquire`: waits for a slot without blocking the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                if self.in_flight < self.limit:
+                    self.in_flight += 1
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    with self._condition:
+                        self._notify()  # Pass on the wake-up this task will not use
+                raise
+
+    def _notify(self):
+        # Called with the condition held when a slot may have become free
+        self._condition.notify_all()
+        if self._async_waiters:
+            loop, waiter = self._async_waiters.popleft()
+            loop.call_soon_threadsafe(self._wake, waiter)
+
+    def _wake(self, waiter):
+        # Runs on the waiter's event loop
+        if waiter.cancelled():
+            with self._condition:
+                self._notify()
+        else:
+            waiter.set_result(None)
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._notify()
+
+    def on_success(self):
+        with self._condition:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.maximum:
+                self.limit += 1
+                self._successes = 0
+                self._notify()
+
+    def on_throttle(self):
+        with self._condition:
+            new_limit = max(self.minimum, self.limit // 2)
+            if new_limit < self.limit:
+                logging.warning(f"Throttled: reducing concurrency from {self.limit} to {new_limit}")
+            self.limit = new_limit
+            self._successes = 0
+
+
+class ProviderLimiter:
+    """
+    Shared client-side limits for one API provider: request and token budgets per
+    minute, an adaptive cap on in-flight requests, and retries with exponential
+    backoff and full jitter that honour Retry-After.
+    """
+    def __init__(self, provider, requests_per_minute=None, tokens_per_minute=None,
+                 max_concurrency=None, max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.provider = provider
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.concurrency = AdaptiveConcurrency(max_concurrency) if max_concurrency else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.throttled = 0
+
+    def wait_time(self, estimated_tokens=0):
+        """
+        Reserve budget for one request and return the seconds to wait before sending it.
+        """
+        wait = 0.0
+        if self.requests:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens and estimated_tokens:
+            wait = max(wait, self.tokens.reserve(estimated_tokens))
+        return wait
+
+    def backoff(self, attempt, error):
+        """
+        Delay before retry number `attempt` (0-based) after `error`.
+        """
+        delay = retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return min(delay, self.max_delay)
+
+    def record_failure(self, error):
+        self.retries += 1
+        if status_code(error) in THROTTLE_STATUSES:
+            self.throttled += 1
+            if self.concurrency:
+                self.concurrency.on_throttle()
+
+    def call(self, request, estimated_tokens=0):
+        """
+        Run `request()` within the provider limits, retrying transient failures.
+        The last error is re-raised once retries are exhausted or for errors that
+        retrying cannot fix (e.g. 400/401).
+        """
+        for attempt in range(self.max_retries + 1):
+            time.sleep(self.wait_time(estimated_tokens))
+            if self.concurrency:
+                self.concurrency.acquire()
+            try:
+                result = request()
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_retries:
+                    raise
+                self.record_failure(e)
+                delay = self.backoff(attempt, e)
+                logging.warning(
+                    f"[{self.provider}] {type(e).__name__} (status {status_code(e)}), "
+                    f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s"
+                )
+            else:
+                if self.concurrency:
+                    self.concurrency.on_success()
+                return result
+            finally:
+                if self.concurrency:
+                    self.concurrency.release()
+            time.sleep(delay)
+
+    async def acall(self, request, estimated_tokens=0):
+        """
+        Async version of `call`: awaits `request()` and waits without blocking
+        the event loop. Thread and async callers share the same budgets.
+        """
+        for attempt in range(self.max_retries + 1):
+            await asyncio.sleep(self.wait_time(estimated_tokens))
+            if self.concurrency:
+                await self.concurrency.aacquire()
+            try:
+                result = await request()
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_retries:
+                    raise
+                self.record_failure(e)
+                delay = self.backoff(attempt, e)
+                logging.warning(
+                    f"[{self.provider}] {type(e).__name__} (status {status_code(e)}), "
+                    f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s"
+                )
+            else:
+                if self.concurrency:
+                    self.concurrency.on_success()
+                return result
+            finally:
+                if self.concurrency:
+                    self.concurrency.release()
+            await asyncio.sleep(delay)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider, **settings):
+    """
+    Return the process-wide limiter for `provider`, creating it with `settings`
+    on first use, so every handler talking to one provider shares its budget.
+    The budget belongs to the provider account, so later callers get the same
+    limiter; a warning is logged when they ask for different settings.
+    """
+    with _limiters_lock:
+        if provider not in _limiters:
+            _limiters[provider] = (ProviderLimiter(provider, **settings), settings)
+        limiter, created_with = _limiters[provider]
+        if settings != created_with:
+            logging.warning(
+                f"[{provider}] Rate limiter already configured with {created_with}; ignoring {settings}"
+            )
+        return limiter
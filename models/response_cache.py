@@ -0,0 +1,293 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+from models.model_handler_base import ModelHandlerBase
+
+ANSWER_EXTRACTION = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "evaluations", "answer_extraction.py"
+)
+
+
+class ResponseCache:
+    """
+    Persistent SQLite cache of model responses keyed by a content hash.
+    Entries older than `max_age_days` are dropped, and the least recently used
+    entries are evicted once the cache holds more than `max_entries` rows.
+    The row count is tracked in memory and eviction runs only once it exceeds
+    the limit by EVICTION_SLACK, so most inserts skip the eviction query.
+    """
+    EVICTION_SLACK = 0.05
+    def __init__(self, path, max_entries=None, max_age_days=None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._rows = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._connection.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(handler_type, model_name, instruction, input_text, task_type, generation_params):
+        """
+        Hash everything that determines a response into a cache key.
+        """
+        payload = json.dumps(
+            [handler_type, model_name, instruction, input_text, task_type, generation_params],
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Look up a cached response.
+        Returns:
+            tuple: (hit, response), where `response` is None on a miss.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            self._connection.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self._connection.commit()
+            return True, json.loads(row[0])
+
+    def put(self, key, response):
+        """
+        Store a response and evict old entries if the cache grew too large.
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(response, ensure_ascii=False), now, now),
+            )
+            self._connection.commit()
+            self._rows += 1  # Overcounts replaced keys; evict() recounts
+        if self.max_entries and self._rows > self.max_entries * (1 + self.EVICTION_SLACK):
+            self.evict()
+
+    def evict(self):
+        """
+        Apply the age and size limits.
+        """
+        with self._lock:
+            if self.max_age_days:
+                cutoff = time.time() - self.max_age_days * 86400
+                self._connection.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,))
+            if self.max_entries:
+                self._connection.execute(
+                    """DELETE FROM responses WHERE key IN (
+                        SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                    )""",
+                    (self.max_entries,),
+                )
+            self._connection.commit()
+            self._rows = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self):
+        """
+        Return hit/miss counters for the current process.
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def extraction_version(path=ANSWER_EXTRACTION):
+    """
+    Hash of the answer extraction source, so responses reduced to letters by an
+    older extractor are not served after it changes.
+    """
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def is_deterministic(generation_params):
+    """
+    Whether the given generation parameters describe greedy decoding.
+    """
+    if not generation_params:
+        return False
+    if generation_params.get("do_sample") is False:
+        return True
+    return generation_params.get("temperature") == 0
+
+
+class CachedModelHandler(ModelHandlerBase):
+    """
+    Wraps any model handler and serves repeated prompts from a ResponseCache.
+    Handlers with deterministic generation parameters are cached; sampled
+    settings are only cached when `cache_sampled` is set. Failed calls
+    (None responses) are never stored. For handlers that return extracted
+    answer letters, the key includes the version of the extraction code.
+    """
+    def __init__(self, handler, cache, handler_type, model_name, cache_sampled=False):
+        self.handler = handler
+        self.cache = cache
+        self.handler_type = handler_type
+        self.model_name = model_name
+        self.generation_params = getattr(handler, "generation_params", None)
+        if hasattr(handler, "mcq_mode"):
+            # Scoring and generating answers for the same prompt must not share entries
+            self.generation_params = {**(self.generation_params or {}), "mcq_mode": handler.mcq_mode}
+        if getattr(handler, "prefix_cache", False):
+            # Cached key/values change the numerics (and possibly the tokens) of the prompt
+            self.generation_params = {**(self.generation_params or {}), "prefix_cache": True}
+        if getattr(handler, "extracts_answers", False):
+            self.generation_params = {**(self.generation_params or {}), "extraction": extraction_version()}
+        self.enabled = cache_sampled or is_deterministic(self.generation_params)
+        if not self.enabled:
+            logging.info(
+                "Response cache disabled for sampled generation settings "
+                "(set cache.sampled: true to cache them anyway)"
+            )
+
+    def __getattr__(self, name):
+        # Delegate anything the wrapper does not define to the wrapped handler
+        if name == "handler":
+            raise AttributeError(name)
+        return getattr(self.handler, name)
+
+    def _make_key(self, input_text, instruction, task_type, kwargs):
+        # Batch size and concurrency change how work is scheduled, not what is generated
+        params = {k: v for k, v in kwargs.items() if k not in ("batch_size", "max_concurrency")}
+        return ResponseCache.make_key(
+            self.handler_type, self.model_name, instruction, input_text, task_type,
+            {**(self.generation_params or {}), **params},
+        )
+
+    def prompt(self, input_text, instruction, task_type=" ", **kwargs):
+        if not self.enabled:
+            return self.handler.prompt(input_text, instruction, task_type, **kwargs)
+
+        key = self._make_key(input_text, instruction, task_type, kwargs)
+        hit, response = self.cache.get(key)
+        if hit:
+            return response
+
+        response = self.handler.prompt(input_text, instruction, task_type, **kwargs)
+        if response is not None:
+            self.cache.put(key, response)
+        return response
+
+    def prompt_batch(self, inputs, instruction, task_type=" ", **kwargs):
+        """
+        Serve cached inputs directly and send only the misses to the handler,
+        using its own `prompt_batch` when it has one.
+        """
+        responses = [None] * len(inputs)
+        keys = [None] * len(inputs)
+        misses = []
+        for i, input_text in enumerate(inputs):
+            if self.enabled:
+                keys[i] = self._make_key(input_text, instruction, task_type, kwargs)
+                hit, response = self.cache.get(keys[i])
+                if hit:
+                    responses[i] = response
+                    continue
+            misses.append(i)
+
+        if not misses:
+            return responses
+
+        if hasattr(self.handler, "prompt_batch"):
+            generated = self.handler.prompt_batch(
+                [inputs[i] for i in misses], instruction, task_type, **kwargs
+            )
+        else:
+            params = {k: v for k, v in kwargs.items() if k != "batch_size"}
+            generated = [
+                self.handler.prompt(inputs[i], instruction, task_type, **params) for i in misses
+            ]
+
+        for i, response in zip(misses, generated):
+            responses[i] = response
+            if self.enabled and response is not None:
+                self.cache.put(keys[i], response)
+        return responses
+
+    async def aprompt(self, input_text, instruction, task_type=" ", **kwargs):
+        if not self.enabled:
+            return await self.handler.aprompt(input_text, instruction, task_type, **kwargs)
+
+        key = self._make_key(input_text, instruction, task_type, kwargs)
+        hit, response = await asyncio.to_thread(self.cache.get, key)
+        if hit:
+            return response
+
+        response = await self.handler.aprompt(input_text, instruction, task_type, **kwargs)
+        if response is not None:
+            await asyncio.to_thread(self.cache.put, key, response)
+        return response
+
+    async def aprompt_batch(self, inputs, instruction, task_type=" ", **kwargs):
+        """
+        Async version of `prompt_batch`: only cache misses reach the handler's
+        `aprompt_batch`.
+        """
+        keys = [
+            self._make_key(input_text, instruction, task_type, kwargs) if self.enabled else None
+            for input_text in inputs
+        ]
+        responses = [None] * len(inputs)
+        misses = []
+        # SQLite calls block, so they run in a worker thread instead of on the event loop
+        lookups = await asyncio.to_thread(
+            lambda: [self.cache.get(key) if self.enabled else (False, None) for key in keys]
+        )
+        for i, (hit, response) in enumerate(lookups):
+            if hit:
+                responses[i] = response
+            else:
+                misses.append(i)
+
+        if misses:
+            generated = await self.handler.aprompt_batch(
+                [inputs[i] for i in misses], instruction, task_type, **kwargs
+            )
+            stored = []
+            for i, response in zip(misses, generated):
+                responses[i] = response
+                if self.enabled and response is not None:
+                    stored.append((keys[i], response))
+            if stored:
+                await asyncio.to_thread(lambda: [self.cache.put(key, response) for key, response in stored])
+        return responses
+
+    def log_stats(self):
+        stats = self.cache.stats()
+        logging.info(
+            f"Response cache {self.cache.path}: {stats['hits']} hits, "
+            f"{stats['misses']} misses ({stats['hit_rate']:.1%} hit rate)"
+        )
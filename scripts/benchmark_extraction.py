@@ -0,0 +1,128 @@
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+import collections
+import pandas as pd
+from evaluations.answer_extraction import extract_answers, STRATEGIES
+from scripts.leaderboard import config_index, describe, prediction_files
+
+logging.basicConfig(level=logging.INFO)
+
+MCQ_TASKS = ["qa", "fib_closed"]
+
+DEFAULT_BASELINE = "results/extraction_baseline.json"
+
+
+def legacy_letter(text):
+    """
+    The ground-truth parser used before `evaluations.answer_extraction`
+    (anchored, Arabic letters only); predictions were compared verbatim.
+    """
+    match = re.match(r'^([أبجدهـه])[\.\)]?', text.strip()) if text else None
+    if not match:
+        return None
+    return 'هـ' if match.group(1) in {'ه', 'هـ'} else match.group(1)
+
+
+def mcq_files(predictions_dir, config_dir):
+    configs = config_index(config_dir)
+    for path in prediction_files(predictions_dir):
+        info = describe(path, configs)
+        if info and info["task"] in MCQ_TASKS:
+            yield path
+
+
+def benchmark_file(path):
+    """
+    Extract every prediction and ground truth of one file.
+    Returns:
+        dict: accuracy before/after, strategy counts, timing and the extracted letters.
+    """
+    df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    inputs = df["input"] if "input" in df else None
+
+    start = time.perf_counter()
+    predicted = extract_answers(df["prediction"], inputs)
+    expected = extract_answers(df["ground_truth"])
+    seconds = time.perf_counter() - start
+
+    correct = predicted["letter"].notna() & (predicted["letter"] == expected["letter"])
+    legacy = sum(p == legacy_letter(g) for p, g in zip(df["prediction"], df["ground_truth"]))
+    counts = collections.Counter(predicted["strategy"])
+    return {
+        "rows": len(df),
+        "accuracy": float(correct.mean()) if len(df) else 0.0,
+        "legacy_accuracy": legacy / len(df) if len(df) else 0.0,
+        "strategies": {strategy: counts.get(strategy, 0) for strategy in STRATEGIES},
+        "unparsed_ground_truths": int(expected["letter"].isna().sum()),
+        "seconds": seconds,
+        "letters": [letter if isinstance(letter, str) else None for letter in predicted["letter"]],
+    }
+
+
+def compare(results, baseline, max_examples=5):
+    """
+    Per-file differences between extracted letters and a saved baseline.
+    Returns:
+        list of str: One line per changed or missing file.
+    """
+    problems = []
+    for path, expected in baseline.items():
+        if path not in results:
+            problems.append(f"{path}: missing")
+            continue
+        letters = results[path]["letters"]
+        if len(letters) != len(expected["letters"]):
+            problems.append(f"{path}: {len(letters)} rows, baseline has {len(expected['letters'])}")
+            continue
+        changed = [i for i, (old, new) in enumerate(zip(expected["letters"], letters)) if old != new]
+        if changed:
+            examples = ", ".join(f"row {i}: {expected['letters'][i]} -> {letters[i]}" for i in changed[:max_examples])
+            problems.append(f"{path}: {len(changed)} extractions changed ({examples})")
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark answer extraction on the MCQ prediction files and check it against a baseline."
+    )
+    parser.add_argument("--predictions-dir", default="results/predictions")
+    parser.add_argument("--config-dir", default="configs")
+    parser.add_argument("--check", nargs="?", const=DEFAULT_BASELINE, help="Fail if extractions differ from a baseline")
+    parser.add_argument("--save", nargs="?", const=DEFAULT_BASELINE, help="Save the extractions as the new baseline")
+    args = parser.parse_args()
+
+    results = {path: benchmark_file(path) for path in mcq_files(args.predictions_dir, args.config_dir)}
+
+    table = pd.DataFrame([
+        {
+            "file": path,
+            "rows": result["rows"],
+            "legacy_acc": round(result["legacy_accuracy"], 3),
+            "acc": round(result["accuracy"], 3),
+            **{strategy: count for strategy, count in result["strategies"].items()},
+        }
+        for path, result in results.items()
+    ])
+    print(table.to_string(index=False))
+
+    rows = sum(result["rows"] for result in results.values())
+    seconds = sum(result["seconds"] for result in results.values())
+    logging.info(f"Extracted {2 * rows} answers and ground truths from {len(results)} files in {seconds * 1000:.0f} ms")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({path: {"letters": result["letters"]} for path, result in results.items()}, f, ensure_ascii=False)
+        logging.info(f"Saved baseline to {args.save}")
+
+    if args.check:
+        with open(args.check) as f:
+            problems = compare(results, json.load(f))
+        for problem in problems:
+            logging.error(problem)
+        if problems:
+            sys.exit(1)
+        logging.info(f"All extractions match {args.check}")
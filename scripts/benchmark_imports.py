@@ -0,0 +1,60 @@
+import sys
+import json
+import logging
+import argparse
+import subprocess
+
+logging.basicConfig(level=logging.INFO)
+
+# Modules whose presence after an import means the heavy ML stack was loaded
+HEAVY_MODULES = ["torch", "transformers", "huggingface_hub", "evaluate", "sentence_transformers"]
+
+DEFAULT_TARGETS = [
+    "models",
+    "evaluations",
+    "models.openai_handler",
+    "models.deepseek_handler",
+    "models.huggingface_handler",
+    "scripts.run_experiment",
+]
+
+
+def measure_import(module_name, repeats=3):
+    """
+    Import `module_name` in fresh interpreters and report the best wall-clock time
+    and which heavy modules ended up loaded.
+    """
+    code = (
+        "import sys, time, json\n"
+        "start = time.perf_counter()\n"
+        f"import {module_name}\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"print(json.dumps({{'seconds': elapsed, 'heavy': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))\n"
+    )
+    timings, heavy = [], []
+    for _ in range(repeats):
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        if result.returncode != 0:
+            error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "unknown error"
+            return {"module": module_name, "error": error}
+        measurement = json.loads(result.stdout.strip().splitlines()[-1])
+        timings.append(measurement["seconds"])
+        heavy = measurement["heavy"]
+    return {"module": module_name, "seconds": min(timings), "heavy_modules": heavy}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure import time of the benchmark packages.")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_TARGETS, help="Modules to import")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    for module_name in args.modules:
+        result = measure_import(module_name, args.repeats)
+        if "error" in result:
+            logging.info(f"{module_name}: failed ({result['error']})")
+        else:
+            logging.info(
+                f"{module_name}: {result['seconds'] * 1000:.0f} ms, "
+                f"heavy modules loaded: {', '.join(result['heavy_modules']) or 'none'}"
+            )
@@ -0,0 +1,97 @@
+import json
+import time
+import logging
+import argparse
+import torch
+from scripts.utils import load_config, load_dataset
+from models import load_model_handler
+from models.prefix_cache import PrefixKVCache, splits_cleanly
+
+logging.basicConfig(level=logging.INFO)
+
+
+def _synchronize():
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+
+def benchmark_prefix_cache(config_path, num_examples=64, batch_size=8):
+    """
+    Compare prefill time with and without the shared instruction KV cache.
+    Both variants run one forward pass per batch over the same prompts built by
+    `HuggingFaceHandler.build_prompt`; tokens/sec counts every prompt token,
+    including those served from the cache.
+    """
+    config = load_config(config_path)
+    config["model"]["prefix_cache"] = False
+    config.pop("cache", None)  # Time the model, not the response cache
+    handler = load_model_handler(config)
+    task_type = config["task"]["type"]
+
+    dataset = load_dataset(config["dataset"]["path"])[:num_examples]
+    with open(config["dataset"]["instruction_path"], "r") as f:
+        instruction = f.read().strip()
+
+    prompts = [handler.build_prompt(item["Question"], instruction, task_type) for item in dataset]
+    prompts = [prompt for prompt in prompts if prompt is not None]
+    batches = [prompts[i:i + batch_size] for i in range(0, len(prompts), batch_size)]
+    total_tokens = sum(len(handler.tokenizer.encode(prompt)) for prompt in prompts)
+
+    # The handler turns the cache off when prefix and question tokenize differently together
+    prefix = f"{instruction}\n\n"
+    split_cleanly = sum(splits_cleanly(handler.tokenizer, prefix, prompt) for prompt in prompts)
+    if split_cleanly < len(prompts):
+        logging.warning(
+            f"{len(prompts) - split_cleanly} of {len(prompts)} prompts tokenize differently with the cached prefix"
+        )
+
+    # Warm-up so CUDA kernels are compiled before timing
+    warmup = handler.tokenizer(batches[0], return_tensors="pt", padding=True).to(handler.model.device)
+    with torch.no_grad():
+        handler.model(**warmup)
+
+    _synchronize()
+    start = time.perf_counter()
+    for batch in batches:
+        encoded = handler.tokenizer(batch, return_tensors="pt", padding=True).to(handler.model.device)
+        position_ids = (encoded["attention_mask"].cumsum(-1) - 1).clamp(min=0)
+        with torch.no_grad():
+            handler.model(**encoded, position_ids=position_ids)
+    _synchronize()
+    baseline_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    prefix_cache = PrefixKVCache(handler.model, handler.tokenizer, prefix)
+    _synchronize()
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for batch in batches:
+        prefix_cache.last_token_logits(batch)
+    _synchronize()
+    cached_time = time.perf_counter() - start
+
+    results = {
+        "prompts": len(prompts),
+        "batch_size": batch_size,
+        "prompt_tokens": total_tokens,
+        "prefix_tokens": prefix_cache.prefix_length,
+        "prompts_split_cleanly": split_cleanly,
+        "baseline_prefill_seconds": baseline_time,
+        "baseline_tokens_per_second": total_tokens / baseline_time,
+        "prefix_cache_build_seconds": build_time,
+        "prefix_cache_prefill_seconds": cached_time,
+        "prefix_cache_tokens_per_second": total_tokens / (cached_time + build_time),
+        "speedup": baseline_time / (cached_time + build_time),
+    }
+    logging.info(f"Prefix cache benchmark: {json.dumps(results, indent=4)}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark prefill with and without the instruction KV cache.")
+    parser.add_argument("config", help="Path to a huggingface experiment config (e.g., configs/aramed_jais.yaml)")
+    parser.add_argument("--num-examples", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=8)
+    args = parser.parse_args()
+    benchmark_prefix_cache(args.config, args.num_examples, args.batch_size)
@@ -1,45 +1,110 @@
 import os
+import re
+import glob
 import json
+import threading
 import pandas as pd
 from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from openai import OpenAI
-from huggingface_hub import login
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+from models.rate_limit import get_limiter, estimate_tokens, log_request_failure
+from models.http_clients import get_http_client, connection_stats
+from models.hf_utils import login_to_hugging_face
+from evaluations.judge_scores import JUDGE_CRITERIA, judgments_filename
 
-os.environ["HF_HOME"] = "/scratch/ca2627/huggingface"
+# A judgment is complete once every score line of datasets/prompt.txt has been
+# followed by a 1-5 score and the last line has ended
+SCORE_LINE_PATTERNS = [re.compile(rf"{re.escape(label)}\W*[1-5]") for label in JUDGE_CRITERIA.values()]
 
-token = os.getenv("HF_TOKEN")
-if token:
-    login(token=token)
-else:
-    raise ValueError("HF_TOKEN is not set")
+
+def judgment_end(text):
+    """
+    Index just past the last required score line of `text`, or None while any
+    score line is still missing or unfinished.
+    """
+    last = None
+    for pattern in SCORE_LINE_PATTERNS:
+        last = pattern.search(text)
+        if last is None:
+            return None
+    newline = text.find("\n", last.end())
+    return None if newline == -1 else newline
+
+
+def truncate_judgment(text):
+    """
+    Drop whatever the judge generated after the four score lines.
+    """
+    end = judgment_end(text)
+    return text[:end].strip() if end is not None else text.strip()
+
+
+def make_stopping_criteria(tokenizer, prompt_length, newline_token_ids):
+    """
+    StoppingCriteriaList that marks each sequence of the batch finished once it
+    contains the four score lines or has ended (EOS/padding), so `generate`
+    stops finished rows and returns when all are done. A sequence is only
+    re-decoded when it has just produced a token containing a newline.
+    """
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    end_token_ids = {token_id for token_id in (tokenizer.eos_token_id, tokenizer.pad_token_id) if token_id is not None}
+
+    class JudgmentComplete(StoppingCriteria):
+        def __init__(self):
+            self.done = None
+
+        def __call__(self, input_ids, scores, **kwargs):
+            if self.done is None:
+                self.done = [False] * input_ids.shape[0]
+            for i, sequence in enumerate(input_ids):
+                if self.done[i] or input_ids.shape[1] <= prompt_length:
+                    continue
+                last_token = int(sequence[-1])
+                if last_token in end_token_ids:
+                    self.done[i] = True
+                elif last_token in newline_token_ids:
+                    text = tokenizer.decode(sequence[prompt_length:], skip_special_tokens=True)
+                    self.done[i] = judgment_end(text) is not None
+            # One flag per row, as transformers expects from stopping criteria
+            return torch.tensor(self.done, dtype=torch.bool, device=input_ids.device)
+
+    return StoppingCriteriaList([JudgmentComplete()])
 
 class OpenAIHandler:
-    def __init__(self, api_key, model="gpt-4"):
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, api_key, model="gpt-4", rate_limit=None, http=None):
+        self.client = OpenAI(api_key=api_key, max_retries=0, http_client=get_http_client("openai", **(http or {})))
         self.model = model
+        self.limiter = get_limiter("openai", **(rate_limit or {}))
 
     def prompt(self, question, instruction):
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": instruction},
-                    {"role": "user", "content": question}
-                ],
-                temperature=0.2,
-                max_tokens=1000,
-                top_p=1.0,
-                frequency_penalty=0.0,
-                presence_penalty=0.0
+            response = self.limiter.call(
+                lambda: self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": instruction},
+                        {"role": "user", "content": question}
+                    ],
+                    temperature=0.2,
+                    max_tokens=1000,
+                    top_p=1.0,
+                    frequency_penalty=0.0,
+                    presence_penalty=0.0
+                ),
+                estimated_tokens=estimate_tokens(instruction, question, max_tokens=1000)
             )
             return response.choices[0].message.content.strip()
         except Exception as e:
-            print(f"[GPT] Error on: {question}\nDetails: {e}")
+            log_request_failure("openai", question, e)
             return None
 
 class HuggingFaceHandler:
     def __init__(self, model_name, cache_dir=None):
+        login_to_hugging_face()
+        from transformers import AutoTokenizer, AutoModelForCausalLM
+
         self.tokenizer = AutoTokenizer.from_pretrained(
             model_name, cache_dir=cache_dir
         )
@@ -48,14 +113,28 @@ class HuggingFaceHandler:
         )
         if self.tokenizer.pad_token_id is None:
             self.tokenizer.pad_token = self.tokenizer.eos_token
+        self._newline_token_ids = None
 
-    def prompt(self, question, instruction):
-        prompt = f"""{instruction}
+    @property
+    def newline_token_ids(self):
+        """
+        Vocabulary ids whose text contains a line break, found once per tokenizer.
+        """
+        if self._newline_token_ids is None:
+            texts = self.tokenizer.batch_decode([[i] for i in range(len(self.tokenizer))])
+            self._newline_token_ids = {i for i, text in enumerate(texts) if "\n" in text}
+        return self._newline_token_ids
+
+    def build_prompt(self, question, instruction):
+        return f"""{instruction}
 
 Question and Response:
 {question}
 
 Evaluation:"""
+
+    def prompt(self, question, instruction):
+        prompt = self.build_prompt(question, instruction)
         try:
             inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
             outputs = self.model.generate(
@@ -63,45 +142,163 @@ Evaluation:"""
                 max_new_tokens=512,
                 do_sample=False,
                 pad_token_id=self.tokenizer.pad_token_id,
+                stopping_criteria=make_stopping_criteria(
+                    self.tokenizer, inputs["input_ids"].shape[1], self.newline_token_ids
+                ),
             )
             generated_text = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-            return generated_text.split("Evaluation:")[-1].strip()
+            return truncate_judgment(generated_text.split("Evaluation:")[-1])
         except Exception as e:
             print(f"[LLAMA] Error on: {question}\nDetails: {e}")
             return None
 
+    def prompt_batch(self, questions, instruction):
+        """
+        Greedy judgments for several rows in one left-padded `generate` call,
+        stopped as soon as every row has produced its four score lines.
+        """
+        prompts = [self.build_prompt(question, instruction) for question in questions]
+        try:
+            self.tokenizer.padding_side = "left"  # Generation continues from the right end
+            inputs = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.model.device)
+            outputs = self.model.generate(
+                **inputs,
+                max_new_tokens=512,
+                do_sample=False,
+                pad_token_id=self.tokenizer.pad_token_id,
+                stopping_criteria=make_stopping_criteria(
+                    self.tokenizer, inputs["input_ids"].shape[1], self.newline_token_ids
+                ),
+            )
+            new_tokens = outputs[:, inputs["input_ids"].shape[1]:]
+            return [
+                truncate_judgment(text.split("Evaluation:")[-1])
+                for text in self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+            ]
+        except Exception as e:
+            print(f"[LLAMA] Error on batch of {len(questions)} rows\nDetails: {e}")
+            return [None] * len(questions)
+
+
+def judge_prompt(row):
+    return f"Question: {row['input']}\n\nModel Response: {row['prediction']}\n\nGround Truth {row['ground_truth']}"
+
+
+def run_api_judge(handler, prompts, instruction, concurrency=8, position=0):
+    """
+    Judge every prompt with an API handler, `concurrency` requests at a time.
+    Returns:
+        list: judgments in prompt order.
+    """
+    judgments = [None] * len(prompts)
+    with tqdm(total=len(prompts), desc="GPT judge", position=position) as progress:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {
+                executor.submit(handler.prompt, prompt_text, instruction): i
+                for i, prompt_text in enumerate(prompts)
+            }
+            for future in as_completed(futures):
+                judgments[futures[future]] = future.result()
+                progress.update(1)
+    return judgments
+
+
+def run_hf_judge(handler, prompts, instruction, batch_size=8, position=1):
+    """
+    Judge every prompt with a local model, `batch_size` rows per `generate` call.
+    Rows are batched in order of length to keep padding small.
+    Returns:
+        list: judgments in prompt order.
+    """
+    judgments = [None] * len(prompts)
+    order = sorted(range(len(prompts)), key=lambda i: len(prompts[i]))
+    with tqdm(total=len(prompts), desc="Llama judge", position=position) as progress:
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            for i, judgment in zip(batch, handler.prompt_batch([prompts[i] for i in batch], instruction)):
+                judgments[i] = judgment
+            progress.update(len(batch))
+    return judgments
+
+
+def judgments_path_for(predictions_path, judgments_dir):
+    """
+    Judge output path for a predictions file, e.g. `results/predictions/aramed_claude.csv`
+    -> `<judgments_dir>/claude_aramed_judge.csv` (see `judgments_filename`).
+    """
+    return os.path.join(judgments_dir, judgments_filename(predictions_path))
+
 
-def run_llm_judging(config_path):
+def run_llm_judging(config_path, predictions=None):
+    """
+    Judge one or more prediction files, loading both judges once.
+    Args:
+        config_path (str): Judge config.
+        predictions (list of str): Optional prediction CSVs or glob patterns. When
+            given, they replace `dataset.path` and each gets its own judgments CSV
+            in `output.judgments_dir` (default: the directory of `output.judgments_path`).
+    """
     import yaml
     with open(config_path, "r") as f:
         config = yaml.safe_load(f)
 
-    dataset_path = config["dataset"]["path"]
     instruction_path = config["instruction_path"]
     cache_dir = config["evaluator"].get("cache_dir")
-    out_path = config["output"]["judgments_path"]
+
+    if predictions:
+        dataset_paths = sorted({path for pattern in predictions for path in (glob.glob(pattern) or [pattern])})
+        judgments_dir = config["output"].get("judgments_dir") or os.path.dirname(config["output"]["judgments_path"])
+        out_paths = [judgments_path_for(path, judgments_dir) for path in dataset_paths]
+    else:
+        dataset_paths = [config["dataset"]["path"]]
+        out_paths = [config["output"]["judgments_path"]]
 
     with open(instruction_path) as f:
         instruction = f.read().strip()
 
-    df = pd.read_csv(dataset_path)
+    frames = [pd.read_csv(path) for path in dataset_paths]
+
+    # Identical (question, response, ground truth) triples across files are judged once
+    frame_prompts = [[judge_prompt(row) for _, row in df.iterrows()] for df in frames]
+    prompts = list(dict.fromkeys(prompt_text for rows in frame_prompts for prompt_text in rows))
+    total_rows = sum(len(rows) for rows in frame_prompts)
+    print(f"Judging {len(frames)} files: {total_rows} rows, {len(prompts)} unique")
 
-    gpt_handler = OpenAIHandler(api_key=os.getenv("OPENAI_API_KEY"), model="gpt-4")
+    gpt_handler = OpenAIHandler(
+        api_key=os.getenv("OPENAI_API_KEY"), model="gpt-4", rate_limit=config.get("rate_limit"),
+        http=config.get("http")
+    )
     llama_handler = HuggingFaceHandler(model_name=config["evaluator"]["name"], cache_dir=cache_dir)
 
 
-    gpt_judgments, llama_judgments = [], []
+    execution = config.get("execution", {})
+
+    # The API judge runs in a background thread while the local judge keeps the
+    # GPU busy, so neither waits on the other
+    results = {}
+
+    def api_pipeline():
+        results["gpt"] = run_api_judge(
+            gpt_handler, prompts, instruction, concurrency=execution.get("concurrency", 8)
+        )
 
-    for _, row in tqdm(df.iterrows(), total=len(df)):
-        prompt_text = f"Question: {row['input']}\n\nModel Response: {row['prediction']}\n\nGround Truth {row['ground_truth']}"
-        gpt_judgments.append(gpt_handler.prompt(prompt_text, instruction))
-        llama_judgments.append(llama_handler.prompt(prompt_text, instruction))
+    api_thread = threading.Thread(target=api_pipeline)
+    api_thread.start()
+    llama_judgments = run_hf_judge(
+        llama_handler, prompts, instruction, batch_size=execution.get("batch_size", 8)
+    )
+    api_thread.join()
 
-    df["gpt_judgment"] = gpt_judgments
-    df["llama_judgment"] = llama_judgments
+    gpt_by_prompt = dict(zip(prompts, results["gpt"]))
+    llama_by_prompt = dict(zip(prompts, llama_judgments))
 
-    df.to_csv(out_path, index=False)
-    print(f"Saved judgments to: {out_path}")
+    for stats in connection_stats():
+        print(f"HTTP pool {stats.summary()}")
+    for df, rows, out_path in zip(frames, frame_prompts, out_paths):
+        df["gpt_judgment"] = [gpt_by_prompt[prompt_text] for prompt_text in rows]
+        df["llama_judgment"] = [llama_by_prompt[prompt_text] for prompt_text in rows]
+        df.to_csv(out_path, index=False)
+        print(f"Saved judgments to: {out_path}")
 
 if __name__ == "__main__":
     import argparse
@@ -113,6 +310,11 @@ if __name__ == "__main__":
         required=True,
         help="Path to the config YAML file (e.g., configs/judge_aramed.yaml)",
     )
+    parser.add_argument(
+        "--predictions",
+        nargs="+",
+        help="Prediction CSVs or glob patterns to judge instead of dataset.path "
+             "(e.g., 'results/predictions/aramed_*.csv')",
+    )
     args = parser.parse_args()
-    run_llm_judging(args.config)
-
+    run_llm_judging(args.config, args.predictions)
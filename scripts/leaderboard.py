@@ -0,0 +1,363 @@
+import os
+import glob
+import json
+import hashlib
+import logging
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from scripts.utils import load_config, is_shard_path
+from evaluations.evaluator import evaluate
+from evaluations.metrics import calculate_bert_score
+
+logging.basicConfig(level=logging.INFO)
+
+# Fallback for prediction files no config writes to: filename prefix -> benchmark.
+# Longer prefixes come first; the English FIB files (fib_en_*, fib_eng_*) are MCQ.
+FILENAME_BENCHMARKS = [
+    ("aramed_gec", "aramed_gec"),
+    ("aramed_mod", "aramed_mod"),
+    ("aramed", "aramed"),
+    ("fib_closed", "fib_closed"),
+    ("fib_open", "fib_open"),
+    ("fib", "fib_closed"),
+    ("qa2", "qa"),
+    ("qa", "qa"),
+]
+
+BENCHMARK_TASKS = {
+    "aramed": "aramed",
+    "aramed_gec": "aramed",
+    "aramed_mod": "aramed",
+    "fib_closed": "fib_closed",
+    "fib_open": "fib_open",
+    "qa": "qa",
+}
+
+EVALUATION_CODE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "evaluations")
+
+LANGUAGE_TOKENS = {"en": "en", "eng": "en", "english": "en", "ar": "ar"}
+
+# Leaderboard cell per task; open-ended tasks fall back to ROUGE-L without BERTScore
+PRIMARY_METRICS = {
+    "qa": ["accuracy"],
+    "fib_closed": ["accuracy"],
+    "fib_open": ["bert_f1", "rougeL"],
+    "aramed": ["bert_f1", "rougeL"],
+}
+
+
+def stem(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def language_of(*names):
+    """
+    "en" if any name has an English marker token (en, eng, english), else "ar".
+    """
+    tokens = {token for name in names for token in stem(name).lower().split("_")}
+    return "en" if any(LANGUAGE_TOKENS.get(token) == "en" for token in tokens) else "ar"
+
+
+def model_label(name, benchmark):
+    """
+    Short model name: `name` (a config or predictions file stem) without its
+    benchmark prefix and language tokens, e.g. aramed_gec_claude -> claude.
+    """
+    tokens = name.split("_")[len(benchmark.split("_")):]
+    return "_".join(token for token in tokens if token and token.lower() not in LANGUAGE_TOKENS) or name
+
+
+def config_index(config_dir):
+    """
+    Map each predictions path written by an experiment config to that config.
+    Configs without `output.predictions_path` (e.g. judge configs) are ignored.
+    """
+    index = {}
+    for path in sorted(glob.glob(os.path.join(config_dir, "*.yaml"))):
+        try:
+            config = load_config(path)
+        except ValueError as e:
+            logging.warning(f"Skipping {path}: {e}")
+            continue
+        predictions_path = ((config or {}).get("output") or {}).get("predictions_path")
+        if predictions_path and "task" in config:
+            index[os.path.normpath(predictions_path)] = (path, config)
+    return index
+
+
+def prediction_files(predictions_dir):
+    """
+    Predictions CSVs in `predictions_dir`. Per-shard outputs of a sharded run
+    are skipped: they only count once merged by `scripts.merge_shards`.
+    """
+    return [
+        path for path in sorted(glob.glob(os.path.join(predictions_dir, "*.csv")))
+        if not is_shard_path(path)
+    ]
+
+
+def describe(predictions_path, configs):
+    """
+    Benchmark, task type, language and model label of a predictions file,
+    taken from the config that writes it or, failing that, from its filename.
+    Returns:
+        dict, or None when the task cannot be inferred.
+    """
+    name = stem(predictions_path)
+    match = configs.get(os.path.normpath(predictions_path))
+    if match:
+        config_path, config = match
+        benchmark = os.path.basename(os.path.dirname(config["dataset"]["path"]))
+        return {
+            "benchmark": benchmark,
+            "task": config["task"]["type"],
+            "language": language_of(name, config["dataset"]["path"], config_path),
+            "model": model_label(stem(config_path), benchmark),
+            "config": config_path,
+        }
+
+    for prefix, benchmark in FILENAME_BENCHMARKS:
+        if name == prefix or name.startswith(prefix + "_"):
+            return {
+                "benchmark": benchmark,
+                "task": BENCHMARK_TASKS[benchmark],
+                "language": language_of(name),
+                "model": model_label(name, prefix),
+                "config": None,
+            }
+    return None
+
+
+def input_hash(predictions_path, task_type, settings):
+    """
+    Hash of everything an evaluation depends on: the predictions file, the
+    task type and the evaluation settings (including the scoring code).
+    """
+    digest = hashlib.sha256()
+    with open(predictions_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    digest.update(json.dumps({"task": task_type, **settings}, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def code_hash(directory=EVALUATION_CODE):
+    """
+    Hash of the evaluation sources, so a change in scoring code (e.g. answer
+    extraction) re-scores every file.
+    """
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(directory, "*.py"))):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def evaluate_file(predictions_path, metrics_path, task_type):
+    """
+    Worker entry point: every metric except BERTScore, which the parent process
+    adds afterwards so that only one copy of the encoder is ever loaded.
+    """
+    # Each worker is one of several processes already; BLEU/ROUGE stay in-process
+    return evaluate(predictions_path, metrics_path, task_type, bert_score=False, workers=1)
+
+
+def add_bert_score(predictions_path, metrics_path, metrics, bert_batch_size=64, embedding_cache=None):
+    """
+    Compute BERTScore for one predictions file in this process and add it to
+    `metrics` and the metrics JSON. The encoder is loaded on the first call
+    and reused for every later file.
+    """
+    df = pd.read_csv(predictions_path, dtype=str, keep_default_na=False)
+    scores = calculate_bert_score(
+        df["prediction"].astype(str).tolist(),
+        df["ground_truth"].astype(str).tolist(),
+        batch_size=bert_batch_size,
+        embedding_cache=embedding_cache,
+    )
+    metrics.update(scores or {})
+    with open(metrics_path, "w") as f:
+        json.dump(metrics, f, indent=4)
+    return metrics
+
+
+def primary_metric(task_type, metrics):
+    for name in PRIMARY_METRICS[task_type]:
+        if metrics.get(name) is not None:
+            return name, metrics[name]
+    return None, None
+
+
+def leaderboard_table(rows):
+    """
+    One row per model and one column per benchmark and language, holding the
+    task's primary metric. When several files cover the same cell, files
+    written by a config win over files matched by name only.
+    """
+    cells = {}
+    for row in sorted(rows, key=lambda row: (row["config"] is None, row["predictions"])):
+        column = f"{row['benchmark']} ({row['language']})"
+        if (row["model"], column) in cells:
+            logging.info(f"Leaderboard uses {cells[row['model'], column][1]} over {row['predictions']}")
+            continue
+        cells[row["model"], column] = (row["score"], row["predictions"])
+
+    table = pd.DataFrame(
+        [{"model": model, "column": column, "score": score} for (model, column), (score, _) in cells.items()]
+    )
+    if table.empty:
+        return table
+    table = table.pivot(index="model", columns="column", values="score")
+    return table[sorted(table.columns)].reset_index()
+
+
+def to_markdown(table, digits=3):
+    """
+    GitHub Markdown table (without requiring `tabulate`).
+    """
+    def cell(value):
+        if isinstance(value, float):
+            return "" if pd.isna(value) else f"{value:.{digits}f}"
+        return str(value)
+
+    lines = [
+        "| " + " | ".join(map(str, table.columns)) + " |",
+        "|" + "|".join("---" for _ in table.columns) + "|",
+    ]
+    lines.extend("| " + " | ".join(cell(value) for value in row) + " |" for row in table.itertuples(index=False))
+    return "\n".join(lines) + "\n"
+
+
+def build_leaderboard(predictions_dir="results/predictions", config_dir="configs", metrics_dir=None,
+                      output_dir="results/leaderboard", workers=None, bert_score=True, bert_batch_size=64,
+                      embedding_cache=None, force=False):
+    """
+    Evaluate every predictions CSV in `predictions_dir` and write a consolidated
+    leaderboard (leaderboard.csv/.json/.md) to `output_dir`, with per-file
+    metrics JSONs in `metrics_dir` (default: `<output_dir>/metrics`).
+    Files whose predictions and evaluation settings hash the same as in the
+    previous run reuse their stored metrics unless `force` is set.
+    Accuracy, BLEU and ROUGE run in a process pool; BERTScore runs afterwards
+    in this process, so one encoder serves all files.
+    Returns:
+        pandas.DataFrame: The leaderboard table.
+    """
+    metrics_dir = metrics_dir or os.path.join(output_dir, "metrics")
+    os.makedirs(metrics_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, "manifest.json")
+    manifest = {}
+    if os.path.exists(manifest_path) and not force:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    hash_settings = {"bert_score": bert_score, "code": code_hash()}
+    configs = config_index(config_dir)
+
+    entries, pending = {}, {}
+    for predictions_path in prediction_files(predictions_dir):
+        info = describe(predictions_path, configs)
+        if info is None:
+            logging.warning(f"Skipping {predictions_path}: cannot infer the task type")
+            continue
+        digest = input_hash(predictions_path, info["task"], hash_settings)
+        entries[predictions_path] = {**info, "hash": digest}
+        previous = manifest.get(predictions_path)
+        if previous and previous["hash"] == digest:
+            entries[predictions_path]["metrics"] = previous["metrics"]
+        else:
+            pending[predictions_path] = info["task"]
+
+    logging.info(f"Evaluating {len(pending)} of {len(entries)} prediction files ({len(entries) - len(pending)} unchanged)")
+    if pending:
+        with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(pending))) as executor:
+            futures = {
+                executor.submit(evaluate_file, path, os.path.join(metrics_dir, stem(path) + ".json"), task_type): path
+                for path, task_type in pending.items()
+            }
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    entries[path]["metrics"] = future.result()
+                    logging.info(f"Evaluated {path}")
+                except Exception as e:
+                    logging.error(f"Evaluation of {path} failed: {e}")
+                    entries.pop(path)
+
+    bert_pending = [
+        path for path, task_type in pending.items()
+        if bert_score and path in entries and "bert_f1" in PRIMARY_METRICS[task_type]
+    ]
+    for path in bert_pending:
+        try:
+            metrics = add_bert_score(
+                path, os.path.join(metrics_dir, stem(path) + ".json"), entries[path]["metrics"],
+                bert_batch_size=bert_batch_size, embedding_cache=embedding_cache,
+            )
+        except Exception as e:
+            logging.error(f"BERTScore for {path} failed: {e}")
+            metrics = entries[path]["metrics"]
+        if "bert_f1" in metrics:
+            logging.info(f"Added BERTScore for {path}")
+        else:
+            # Not recorded in the manifest, so the next run retries BERTScore
+            entries[path]["hash"] = None
+
+    rows = []
+    for path, entry in entries.items():
+        metric, score = primary_metric(entry["task"], entry["metrics"])
+        rows.append({
+            "predictions": path,
+            **{key: entry[key] for key in ("model", "benchmark", "task", "language", "config")},
+            "metric": metric,
+            "score": score,
+            "metrics": entry["metrics"],
+        })
+
+    table = leaderboard_table(rows)
+    table.to_csv(os.path.join(output_dir, "leaderboard.csv"), index=False)
+    with open(os.path.join(output_dir, "leaderboard.json"), "w") as f:
+        json.dump({"leaderboard": table.to_dict(orient="records"), "files": rows}, f, indent=4)
+    with open(os.path.join(output_dir, "leaderboard.md"), "w") as f:
+        f.write(to_markdown(table))
+    with open(manifest_path, "w") as f:
+        json.dump(
+            {
+                path: {"hash": entry["hash"], "metrics": entry["metrics"]}
+                for path, entry in entries.items() if entry["hash"]
+            },
+            f,
+            indent=4,
+        )
+
+    print(table.to_string(index=False))
+    logging.info(f"Leaderboard saved to {output_dir}")
+    return table
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Evaluate all prediction files and build a leaderboard.")
+    parser.add_argument("--predictions-dir", default="results/predictions")
+    parser.add_argument("--config-dir", default="configs", help="Configs used to infer each file's task type")
+    parser.add_argument("--metrics-dir", help="Where per-file metrics JSONs are written (default: <output-dir>/metrics)")
+    parser.add_argument("--output-dir", default="results/leaderboard")
+    parser.add_argument("--workers", type=int, help="Evaluation processes (default: all CPUs)")
+    parser.add_argument("--no-bertscore", action="store_true", help="Skip BERTScore (no torch/encoder needed)")
+    parser.add_argument("--bert-batch-size", type=int, default=64)
+    parser.add_argument("--embedding-cache", help="Directory of persisted BERTScore embeddings")
+    parser.add_argument("--force", action="store_true", help="Re-evaluate every file, ignoring the manifest")
+    args = parser.parse_args()
+
+    build_leaderboard(
+        predictions_dir=args.predictions_dir,
+        config_dir=args.config_dir,
+        metrics_dir=args.metrics_dir,
+        output_dir=args.output_dir,
+        workers=args.workers,
+        bert_score=not args.no_bertscore,
+        bert_batch_size=args.bert_batch_size,
+        embedding_cache=args.embedding_cache,
+        force=args.force,
+    )
@@ -0,0 +1,74 @@
+import os
+import re
+import glob
+import logging
+from scripts.utils import load_config, get_checkpoint_path, get_shard_path, load_checkpoint, save_predictions, shard_of
+from scripts.run_experiment import evaluate_predictions
+
+logging.basicConfig(level=logging.INFO)
+
+
+def find_shard_count(output_path):
+    """
+    Infer N from the `<name>.shard-i-of-N.csv` files next to `output_path`.
+    """
+    root, extension = os.path.splitext(output_path)
+    pattern = re.compile(re.escape(root) + r"\.shard-\d+-of-(\d+)" + re.escape(extension) + "$")
+    counts = {
+        int(match.group(1))
+        for path in glob.glob(f"{glob.escape(root)}.shard-*-of-*{extension}")
+        for match in [pattern.match(path)] if match
+    }
+    if len(counts) != 1:
+        found = ", ".join(map(str, sorted(counts))) or "none"
+        raise ValueError(f"Cannot infer the shard count for {output_path} (found: {found}); pass --shards")
+    return counts.pop()
+
+
+def merge_shards(config_path, num_shards=None, evaluate=True):
+    """
+    Reassemble the per-shard predictions of a config into its predictions CSV,
+    in id order, and evaluate it once.
+    Every shard must have finished (its predictions CSV exists). Records are
+    read from the shard checkpoints and checked against the id partition.
+    Returns:
+        dict: Evaluation metrics, or None with `evaluate=False`.
+    """
+    config = load_config(config_path)
+    output_path = config['output']['predictions_path']
+    num_shards = num_shards or find_shard_count(output_path)
+
+    shard_paths = [get_shard_path(output_path, (index, num_shards)) for index in range(num_shards)]
+    missing = [path for path in shard_paths if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError(f"Shards not finished: {', '.join(missing)}")
+
+    predictions = {}
+    for index, shard_path in enumerate(shard_paths):
+        records = load_checkpoint(get_checkpoint_path(shard_path))
+        for record in records:
+            if shard_of(record["id"], num_shards) != index:
+                raise ValueError(f"Id {record['id']} in {shard_path} belongs to shard {shard_of(record['id'], num_shards)}")
+            if record["id"] in predictions:
+                raise ValueError(f"Duplicate id {record['id']} in {shard_path}")
+            predictions[record["id"]] = record
+        logging.info(f"Loaded {len(records)} predictions from shard {index}/{num_shards}")
+
+    merged = [predictions[item_id] for item_id in sorted(predictions)]
+    logging.info(f"Saving {len(merged)} merged predictions to {output_path}")
+    save_predictions(merged, output_path)
+
+    if not evaluate:
+        return None
+    return evaluate_predictions(config, output_path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Merge the shard outputs of a sharded run and evaluate them once.")
+    parser.add_argument("config", help="Config the shards were run with")
+    parser.add_argument("--shards", type=int, help="Number of shards (default: inferred from the shard files)")
+    parser.add_argument("--no-evaluate", action="store_true", help="Only write the merged predictions CSV")
+    args = parser.parse_args()
+    merge_shards(args.config, args.shards, evaluate=not args.no_evaluate)
@@ -0,0 +1,191 @@
+import os
+import csv
+import json
+import mmap
+import struct
+import logging
+from array import array
+import numpy as np
+
+MAGIC = b"MQPACK01"
+# magic, record count, index offset, header offset, header length
+PREAMBLE = struct.Struct("<8sQQQQ")
+
+
+class DatasetView:
+    """
+    A lazily evaluated selection of records (a slice or shard) of a
+    PackedDataset. Records are only decoded when accessed.
+    """
+    def __init__(self, dataset, positions):
+        self.dataset = dataset
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return DatasetView(self.dataset, self.positions[index])
+        return self.dataset.record(self.positions[index])
+
+    def __iter__(self):
+        for position in self.positions:
+            yield self.dataset.record(position)
+
+    def ids(self):
+        """
+        Dataset ids (1-based positions in the full dataset) of the selected records.
+        """
+        return [position + 1 for position in self.positions]
+
+    def items(self):
+        """
+        Yield (id, record) pairs.
+        """
+        for position in self.positions:
+            yield position + 1, self.dataset.record(position)
+
+
+class PackedDataset:
+    """
+    Read-only dataset in the packed format written by `pack_records`: one file
+    holding the records as compact UTF-8 JSON back to back, a uint64 offset
+    index and a small JSON header. The file is memory-mapped, so opening it
+    costs the same for any dataset size, and only the pages of records
+    actually read are loaded.
+
+    Records keep the fields of the source JSON/CSV (`Question`, `Answer`, ...).
+    Ids are 1-based positions, matching the ids `run_experiment` assigns.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, index_offset, header_offset, header_length = PREAMBLE.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a packed dataset")
+        self.header = json.loads(self._mmap[header_offset:header_offset + header_length])
+        self._data_start = PREAMBLE.size
+        self._offsets = np.frombuffer(self._mmap, dtype="<u8", count=count + 1, offset=index_offset)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def record(self, position):
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        return json.loads(self._mmap[self._data_start + start:self._data_start + end])
+
+    def get(self, item_id):
+        """
+        The record with dataset id `item_id` (1-based).
+        """
+        if not 1 <= item_id <= len(self):
+            raise KeyError(item_id)
+        return self.record(item_id - 1)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return DatasetView(self, range(len(self))[index])
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.record(index)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self.record(position)
+
+    def view(self):
+        return DatasetView(self, range(len(self)))
+
+    def shard(self, index, count):
+        """
+        Records of shard `index` out of `count` (every `count`-th record,
+        starting at position `index`).
+        """
+        if not 0 <= index < count:
+            raise ValueError(f"Shard index {index} out of range for {count} shards")
+        return DatasetView(self, range(index, len(self), count))
+
+    def close(self):
+        self._offsets = None  # Release the buffer exported from the mmap
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def pack_records(records, output_path, source=None):
+    """
+    Write an iterable of dict records to `output_path` in the packed format,
+    streaming them to disk one at a time.
+    Returns:
+        int: Number of records written.
+    """
+    offsets = array("Q", [0])
+    fields = {}
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, 0, 0, 0, 0))
+        for record in records:
+            fields.update(dict.fromkeys(record))
+            encoded = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            f.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+
+        f.write(b"\0" * (-f.tell() % 8))  # Keep the uint64 index aligned
+        index_offset = f.tell()
+        offsets.tofile(f)
+        header_offset = f.tell()
+        header = json.dumps({"format": 1, "source": source, "fields": list(fields)}, ensure_ascii=False).encode("utf-8")
+        f.write(header)
+        f.seek(0)
+        f.write(PREAMBLE.pack(MAGIC, len(offsets) - 1, index_offset, header_offset, len(header)))
+    os.replace(tmp_path, output_path)
+    return len(offsets) - 1
+
+
+def read_source_records(path):
+    """
+    Stream records from a JSON array or a CSV file. Empty CSV cells become
+    None, as in the datasets' CSV->JSON conversion scripts.
+    """
+    if path.endswith(".csv"):
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                yield {key: (value if value != "" else None) for key, value in row.items()}
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+
+
+def convert(source_path, output_path=None):
+    """
+    Convert a JSON or CSV dataset to the packed format (default: same path
+    with a `.pack` extension).
+    """
+    output_path = output_path or os.path.splitext(source_path)[0] + ".pack"
+    count = pack_records(read_source_records(source_path), output_path, source=source_path)
+    logging.info(f"Packed {count} records from {source_path} into {output_path}")
+    return output_path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Convert JSON/CSV datasets to the memory-mapped packed format.")
+    parser.add_argument("sources", nargs="+", help="Dataset JSON or CSV files")
+    parser.add_argument("--output", help="Output path (single source only; default: <source>.pack)")
+    args = parser.parse_args()
+    if args.output and len(args.sources) > 1:
+        parser.error("--output needs a single source")
+
+    for source in args.sources:
+        convert(source, args.output)
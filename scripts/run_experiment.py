@@ -1,72 +1,339 @@
 import os
 import json
+import time
+import queue
+import asyncio
+import threading
 import pandas as pd
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm  # Import tqdm for progress bar
-from scripts.utils import load_config, save_predictions
-from models import load_model_handler
+from scripts.utils import (
+    load_config, load_dataset, dataset_items, get_shard_path, parse_shard, save_predictions, get_checkpoint_path,
+    load_checkpoint
+)
+from models import load_model_handler, CachedModelHandler
+from models.http_clients import log_connection_stats
 from evaluations.evaluator import evaluate        # Import the evaluator
+from evaluations.streaming import StreamingEvaluator
 
 logging.basicConfig(level=logging.INFO)           # Configure logging
 
-def run_experiment(config_path):
+
+def make_record(item, prediction):
+    """
+    Build a prediction record in the predictions CSV layout.
+    """
+    return {
+        "id": item["id"],
+        "input": item["input"],
+        "prediction": prediction,
+        "ground_truth": item["ground_truth"]
+    }
+
+
+def predict_item(model_handler, item, instruction, task_type):
+    """
+    Run a single dataset item through the model handler.
+    Args:
+        model_handler: Handler returned by `load_model_handler`.
+        item (dict): Work item with `id`, `input` and `ground_truth` keys.
+        instruction (str): Instruction text passed as system prompt.
+        task_type (str): Task type from the config.
+    Returns:
+        dict: Prediction record in the predictions CSV layout.
+    """
+    # Pass instruction as system_prompt
+    prediction = model_handler.prompt(item["input"], instruction, task_type)
+    return make_record(item, prediction)
+
+
+def generate_predictions_async(model_handler, items, instruction, task_type, concurrency):
+    """
+    Drive `aprompt` calls from one event loop, with up to `concurrency` requests
+    in flight. The loop runs in a background thread so records can still be
+    yielded (and checkpointed) as they complete.
+    Yields:
+        dict: Prediction records in completion order.
+    """
+    records = queue.Queue()
+    done = object()
+
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def predict(item):
+            async with semaphore:
+                prediction = await model_handler.aprompt(item["input"], instruction, task_type)
+            records.put(make_record(item, prediction))
+
+        await asyncio.gather(*(predict(item) for item in items))
+
+    def worker():
+        try:
+            asyncio.run(run())
+        except Exception as e:
+            records.put(e)
+        finally:
+            records.put(done)
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    while (record := records.get()) is not done:
+        if isinstance(record, Exception):
+            raise record
+        yield record
+    thread.join()
+
+
+def supports_batching(model_handler):
+    """
+    Whether the handler generates several prompts per call. The response cache
+    defines `prompt_batch` for every handler, so check the handler it wraps.
+    """
+    if isinstance(model_handler, CachedModelHandler):
+        model_handler = model_handler.handler
+    return hasattr(model_handler, "prompt_batch")
+
+
+def generate_predictions(model_handler, items, instruction, task_type, concurrency=1, batch_size=1,
+                         use_async=False):
+    """
+    Generate predictions for all work items.
+    Handlers with a `prompt_batch` method are called with `batch_size` prompts per
+    forward pass; with `use_async` prompts go through the handler's `aprompt` on
+    an event loop; otherwise prompts go through a bounded thread pool of `concurrency`
+    workers. Records are yielded in completion order; callers sort by `id` when needed.
+    Args:
+        model_handler: Handler returned by `load_model_handler`.
+        items (list of dict): Work items with `id`, `input` and `ground_truth` keys.
+        instruction (str): Instruction text passed as system prompt.
+        task_type (str): Task type from the config.
+        concurrency (int): Maximum number of in-flight `prompt` calls.
+        batch_size (int): Number of prompts per batched generation call.
+        use_async (bool): Use `aprompt` with `concurrency` requests in flight.
+    Yields:
+        dict: Prediction records.
+    """
+    progress = tqdm(total=len(items), desc="Processing examples")
+    start = time.perf_counter()
+
+    # Hand over several batches at a time so the handler can bucket prompts by length
+    group_size = batch_size * 4
+
+    if getattr(model_handler, "mcq_mode", "generate") == "logits" and task_type in ["qa", "fib_closed"]:
+        # One forward pass per batch; keep the option distribution next to the prediction
+        for group_start in range(0, len(items), group_size):
+            group = items[group_start:group_start + group_size]
+            results = model_handler.score_options_batch(
+                [item["input"] for item in group], instruction, batch_size=batch_size
+            )
+            for item, result in zip(group, results):
+                record = make_record(item, result["prediction"])
+                record["option_probs"] = json.dumps(result["probabilities"], ensure_ascii=False)
+                yield record
+                progress.update(1)
+    elif batch_size > 1 and supports_batching(model_handler):
+        for group_start in range(0, len(items), group_size):
+            group = items[group_start:group_start + group_size]
+            outputs = model_handler.prompt_batch(
+                [item["input"] for item in group], instruction, task_type, batch_size=batch_size
+            )
+            for item, prediction in zip(group, outputs):
+                yield make_record(item, prediction)
+                progress.update(1)
+    elif use_async:
+        for record in generate_predictions_async(model_handler, items, instruction, task_type, concurrency):
+            yield record
+            progress.update(1)
+    elif concurrency <= 1:
+        for item in items:
+            yield predict_item(model_handler, item, instruction, task_type)
+            progress.update(1)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [
+                executor.submit(predict_item, model_handler, item, instruction, task_type)
+                for item in items
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+                progress.update(1)
+
+    progress.close()
+    elapsed = time.perf_counter() - start
+    if items and elapsed > 0:
+        logging.info(
+            f"Generated {len(items)} predictions in {elapsed:.1f}s "
+            f"({len(items) / elapsed:.2f} requests/sec, concurrency={concurrency}, batch_size={batch_size})"
+        )
+
+
+def generate_batch_predictions(model_handler, items, instruction, batch_path, poll_interval=30):
+    """
+    Generate predictions for all work items through the provider's offline batch
+    API (OpenAI-compatible handlers only). Blocks until the batch finishes.
+    Yields:
+        dict: Prediction records, in dataset order.
+    """
+    if not hasattr(model_handler, "submit_batch"):
+        raise ValueError(f"{type(model_handler).__name__} does not support execution mode 'batch'")
+    if not items:
+        return
+    predictions = model_handler.submit_batch(items, instruction, batch_path, poll_interval=poll_interval)
+    for item in items:
+        yield make_record(item, predictions.get(item["id"]))
+
+
+def evaluate_predictions(config, predictions_path):
+    """
+    Evaluate a predictions CSV with the config's task type and evaluation settings.
+    """
+    metrics_path = config['output']['metrics_path']
+    task_type = config['task']['type']
+    logging.info("Starting evaluation...")
+    evaluation_config = config.get('evaluation', {})
+    metrics = evaluate(
+        predictions_path,
+        metrics_path,
+        task_type,
+        bert_batch_size=evaluation_config.get('bert_batch_size', 64),
+        embedding_cache=evaluation_config.get('embedding_cache')
+    )
+    logging.info(f"Evaluation completed. Metrics saved to {metrics_path}")
+    logging.info(f"Metrics: {json.dumps(metrics, indent=4)}")
+    return metrics
+
+
+def run_experiment(config_path, resume=False, model_handler=None, shard=None):
+    """
+    Generate predictions for one config and evaluate them.
+    Args:
+        config_path (str): Path to the experiment config.
+        resume (bool): Skip ids already present in the predictions checkpoint.
+        model_handler: Already loaded handler to reuse; loaded from the config if None.
+        shard (tuple): Optional (index, count) from `parse_shard`. Only that
+            shard's ids are generated, into a per-shard predictions file, and
+            evaluation is left to `scripts.merge_shards`.
+    Returns:
+        dict: Evaluation metrics, or None for a shard.
+    """
     logging.info(f"Loading config from {config_path}")
-    config = load_config(config_path)  # Load config file 
-    logging.info(f"Initializing model: {config['model']['name']}")
-    
-    # Load the appropriate model handler
-    model_handler = load_model_handler(config)
+    config = load_config(config_path)  # Load config file
+
+    if model_handler is None:
+        logging.info(f"Initializing model: {config['model']['name']}")
+        # Load the appropriate model handler
+        model_handler = load_model_handler(config)
     logging.info(f"Loading dataset from {config['dataset']['path']}")
     dataset_path = config['dataset']['path']
     instruction_path = config['dataset'].get('instruction_path')
     task_type = config['task']['type']
+    execution = config.get('execution', {})
+    concurrency = execution.get('concurrency', 1)
+    batch_size = execution.get('batch_size', 1)
 
-    # Load dataset with utf-8 encoding
-    with open(dataset_path, 'r', encoding='utf-8') as f:
-        dataset = json.load(f)
+    # JSON and CSV datasets are read whole; packed datasets are memory-mapped
+    dataset = load_dataset(dataset_path)
 
     with open(instruction_path, 'r') as f:
         instruction = f.read().strip()
 
-    predictions = []
+    output_path = config['output']['predictions_path']
+    if shard:
+        output_path = get_shard_path(output_path, shard)
+        logging.info(f"Running shard {shard[0]}/{shard[1]} into {output_path}")
+    checkpoint_path = get_checkpoint_path(output_path)
+    completed = load_checkpoint(checkpoint_path) if resume else []
+    # Failed items (no prediction) are retried; their new record supersedes the old one
+    failed = sum(record.get("prediction") is None for record in completed)
+    completed = [record for record in completed if record.get("prediction") is not None]
+    completed_ids = {record["id"] for record in completed}
+    if completed_ids or failed:
+        logging.info(
+            f"Resuming from {checkpoint_path}: {len(completed_ids)} predictions already on disk, {failed} failed to retry"
+        )
 
-     # Generate predictions with a progress bar
-    for idx, item in enumerate(tqdm(dataset, desc="Processing examples"), start=1):
+    items = []
+    for idx, item in dataset_items(dataset, shard):
         input_text = item.get('Question')
         if not input_text:
             logging.warning(f"No input text found for item {idx}. Skipping.")
             continue
+        if idx in completed_ids:
+            continue
+        items.append({"id": idx, "input": input_text, "ground_truth": item.get('Answer')})
 
-        # Pass instruction as system_prompt
-        prediction = model_handler.prompt(input_text, instruction, task_type)
+    # Running metric estimates, logged every `live_every` predictions
+    live_every = config.get('evaluation', {}).get('live_every', 50)
+    live_metrics = StreamingEvaluator(task_type) if live_every else None
+    if live_metrics:
+        for record in completed:
+            live_metrics.update(record)
 
-        predictions.append({
-            "id": idx,
-            "input": input_text,
-            "prediction": prediction,
-            "ground_truth": item.get('Answer')
-        })
+    # Stream predictions to the append-only checkpoint as they complete
+    with open(checkpoint_path, 'a' if resume else 'w', encoding='utf-8') as checkpoint:
+        if resume:
+            checkpoint.write("\n")  # Terminate a last line possibly cut off by a crash
+        if execution.get('mode') == 'batch':
+            batch_path = os.path.splitext(output_path)[0] + ".batch_input.jsonl"
+            records = generate_batch_predictions(
+                model_handler, items, instruction, batch_path, execution.get('poll_interval', 30)
+            )
+        else:
+            records = generate_predictions(
+                model_handler, items, instruction, task_type, concurrency, batch_size,
+                use_async=execution.get('async', False)
+            )
+        for record in records:
+            checkpoint.write(json.dumps(record, ensure_ascii=False) + "\n")
+            checkpoint.flush()
+            if live_metrics:
+                live_metrics.update(record)
+                if live_metrics.count % live_every == 0:
+                    logging.info(f"Live metrics after {live_metrics.count} predictions: {live_metrics.format()}")
+
+    if isinstance(model_handler, CachedModelHandler):
+        model_handler.log_stats()
+    log_connection_stats()
+
+    predictions = load_checkpoint(checkpoint_path)
+    predictions.sort(key=lambda record: record["id"])  # Keep dataset order in the CSV
 
     # Save predictions to file
-    output_path = config['output']['predictions_path']
     logging.info(f"Saving predictions to {output_path}")
     save_predictions(predictions, output_path)
+    failed = sum(record.get("prediction") is None for record in predictions)
+    if failed:
+        logging.warning(f"{failed} of {len(predictions)} requests failed; rerun with --resume to retry them")
 
 
+    if shard:
+        logging.info(f"Shard {shard[0]}/{shard[1]} done; run scripts/merge_shards.py to merge and evaluate")
+        return None
+
     # Perform evaluation
-    metrics_path = config['output']['metrics_path']
-    task_type = config['task']['type']
-    logging.info("Starting evaluation...")
-    metrics = evaluate(output_path, metrics_path, task_type)
-    logging.info(f"Evaluation completed. Metrics saved to {metrics_path}")
-    logging.info(f"Metrics: {json.dumps(metrics, indent=4)}")
+    return evaluate_predictions(config, output_path)
 
 # Run the script
 if __name__ == "__main__":
-    import sys
-    config_file = sys.argv[1]  # Give config file as a command-line argument
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a benchmark experiment.")
+    parser.add_argument("config", help="Path to the config YAML file (e.g., configs/qa_gpt4.yaml)")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip ids already present in the predictions checkpoint instead of starting over",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        help="Only run shard i of N (e.g. 0/4); ids are dealt round-robin and each shard writes its own files",
+    )
+    args = parser.parse_args()
     try:
-        run_experiment(config_file)
+        run_experiment(args.config, resume=args.resume, shard=args.shard)
     except Exception as e:
         logging.error(f"An error occurred: {e}")
         raise
@@ -0,0 +1,151 @@
+import gc
+import sys
+import glob
+import json
+import time
+import logging
+import pandas as pd
+from scripts.utils import load_config
+from scripts.run_experiment import run_experiment
+from models import load_model_handler
+
+logging.basicConfig(level=logging.INFO)
+
+
+def expand_config_paths(patterns):
+    """
+    Expand config paths and glob patterns into a sorted, de-duplicated list.
+    """
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) or [pattern]
+        paths.extend(path for path in matches if path not in paths)
+    return paths
+
+
+def handler_key(config):
+    """
+    The settings that determine which handler `load_model_handler` builds, so
+    that configs sharing a key can share one loaded model. `cache_dir` only
+    picks where downloads are stored and is ignored. Of `execution`, only
+    `concurrency` reaches the handler (as its in-flight limit); batch size and
+    mode are applied per run.
+    """
+    model = {key: value for key, value in config["model"].items() if key != "cache_dir"}
+    return json.dumps(
+        {
+            "model": model,
+            "generation": config.get("generation"),
+            "cache": config.get("cache"),
+            "rate_limit": config.get("rate_limit"),
+            "http": config.get("http"),
+            "concurrency": (config.get("execution") or {}).get("concurrency", 1),
+        },
+        sort_keys=True,
+    )
+
+
+def group_configs(config_paths):
+    """
+    Group experiment configs by the model handler they need.
+    Returns:
+        dict: handler key -> list of (config path, config) pairs, in input order.
+    """
+    groups = {}
+    for path in config_paths:
+        config = load_config(path)
+        if not config or "model" not in config:
+            logging.warning(f"Skipping {path}: not an experiment config")
+            continue
+        groups.setdefault(handler_key(config), []).append((path, config))
+    return groups
+
+
+def free_model_memory():
+    """
+    Reclaim the memory of a dropped handler before the next model loads.
+    """
+    gc.collect()
+    if "torch" in sys.modules:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+def run_matrix(patterns, resume=False, summary_path=None):
+    """
+    Run many experiment configs, loading each distinct model only once.
+    Args:
+        patterns (list of str): Config paths or glob patterns (e.g. "configs/qa_*.yaml").
+        resume (bool): Passed to `run_experiment` for every config.
+        summary_path (str): Optional CSV path for the consolidated summary.
+    Returns:
+        pandas.DataFrame: One row per config with timing, status and metrics.
+    """
+    groups = group_configs(expand_config_paths(patterns))
+    logging.info(
+        f"Running {sum(len(entries) for entries in groups.values())} configs "
+        f"with {len(groups)} distinct models"
+    )
+
+    rows = []
+    for entries in groups.values():
+        model_config = entries[0][1]["model"]
+        logging.info(f"Initializing model: {model_config['name']} ({len(entries)} configs)")
+        start = time.perf_counter()
+        try:
+            model_handler = load_model_handler(entries[0][1])
+            load_error = None
+        except Exception as e:
+            logging.error(f"Loading {model_config['name']} failed: {e}")
+            model_handler, load_error = None, e
+        load_seconds = time.perf_counter() - start
+
+        for path, config in entries:
+            start = time.perf_counter()
+            if load_error is not None:
+                metrics, status = {}, f"failed: model load: {load_error}"
+            else:
+                try:
+                    metrics = run_experiment(path, resume=resume, model_handler=model_handler)
+                    status = "ok"
+                except Exception as e:
+                    logging.error(f"Config {path} failed: {e}")
+                    metrics, status = {}, f"failed: {e}"
+            rows.append({
+                "config": path,
+                "model_type": model_config["type"],
+                "model": model_config["name"],
+                "task": config["task"]["type"],
+                "dataset": config["dataset"]["path"],
+                "status": status,
+                "load_seconds": round(load_seconds, 1),
+                "run_seconds": round(time.perf_counter() - start, 1),
+                **(metrics or {}),
+            })
+            load_seconds = 0.0  # Only the first config of a group pays for loading
+
+        del model_handler
+        free_model_memory()
+
+    summary = pd.DataFrame(rows)
+    print(summary.to_string(index=False))
+    if summary_path:
+        summary.to_csv(summary_path, index=False)
+        logging.info(f"Saved summary to {summary_path}")
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a matrix of experiment configs, loading each model once.")
+    parser.add_argument(
+        "configs",
+        nargs="+",
+        help="Config paths or glob patterns (e.g., 'configs/*_jais.yaml')",
+    )
+    parser.add_argument("--resume", action="store_true", help="Resume every config from its checkpoint")
+    parser.add_argument("--summary", help="Optional CSV path for the consolidated summary table")
+    args = parser.parse_args()
+    run_matrix(args.configs, resume=args.resume, summary_path=args.summary)
@@ -0,0 +1,256 @@
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logging.basicConfig(level=logging.INFO)
+
+
+class StubState:
+    """
+    Settings and counters shared by all request threads.
+    """
+    def __init__(self, latency=0.0, error_rate=0.0, retry_after=None, answer="أ", throttle_first=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_first = throttle_first  # Deterministic 429s for the first N requests
+        self.retry_after = retry_after
+        self.answer = answer
+        self.requests = 0
+        self.throttled = 0
+        self.files = {}    # file id -> (filename, bytes)
+        self.batches = {}  # batch id -> batch object
+        self.lock = threading.Lock()
+
+    def add_file(self, filename, content, purpose):
+        with self.lock:
+            file_id = f"file-stub-{len(self.files) + 1}"
+            self.files[file_id] = (filename, content)
+        return {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+
+    def run_batch(self, batch_id):
+        """
+        Answer every request of a batch input file in the background, producing
+        an output file in the batch API format.
+        """
+        batch = self.batches[batch_id]
+        batch["status"] = "in_progress"
+        batch["in_progress_at"] = int(time.time())
+        _, content = self.files[batch["input_file_id"]]
+        lines = [json.loads(line) for line in content.decode("utf-8").splitlines() if line.strip()]
+        batch["request_counts"]["total"] = len(lines)
+
+        results = []
+        for i, request in enumerate(lines):
+            time.sleep(self.latency)
+            results.append({
+                "id": f"batch_req_{i}",
+                "custom_id": request["custom_id"],
+                "response": {
+                    "status_code": 200,
+                    "request_id": f"req_{i}",
+                    "body": chat_completion(request["body"].get("model", "stub"), self.answer),
+                },
+                "error": None,
+            })
+            batch["request_counts"]["completed"] += 1
+
+        output = "".join(json.dumps(result, ensure_ascii=False) + "\n" for result in results)
+        batch["output_file_id"] = self.add_file(f"{batch_id}_output.jsonl", output.encode("utf-8"), "batch_output")["id"]
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Minimal OpenAI-compatible chat completions endpoint that injects latency and
+    429 responses, for exercising retries, rate limiting and concurrency locally.
+    Also serves the file upload and batch endpoints used by execution mode "batch".
+    """
+    state = None
+    protocol_version = "HTTP/1.1"  # Keep connections alive like real APIs
+    disable_nagle_algorithm = True  # Headers and body are written separately
+
+    def log_message(self, format, *args):
+        pass  # Keep the console quiet under load
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length)
+
+    def _read_json(self):
+        return json.loads(self._read_body() or b"{}")
+
+    def _not_found(self):
+        self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_GET(self):
+        path = self.path.rstrip("/")
+        parts = path.split("/")
+        if path == "/stats":
+            self._send_json(200, {"requests": self.state.requests, "throttled": self.state.throttled})
+        elif path.endswith("/content") and len(parts) >= 3 and parts[-3] == "files":
+            entry = self.state.files.get(parts[-2])
+            if entry is None:
+                self._not_found()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(entry[1])))
+            self.end_headers()
+            self.wfile.write(entry[1])
+        elif len(parts) >= 2 and parts[-2] == "batches" and parts[-1] in self.state.batches:
+            self._send_json(200, self.state.batches[parts[-1]])
+        else:
+            self._not_found()
+
+    def do_POST(self):
+        path = self.path.rstrip("/")
+        if path.endswith("/files"):
+            self._upload_file()
+            return
+        if path.endswith("/batches"):
+            self._create_batch()
+            return
+        if not path.endswith("/chat/completions"):
+            self._not_found()
+            return
+
+        request = self._read_json()
+        with self.state.lock:
+            self.state.requests += 1
+            throttle = (
+                self.state.requests <= self.state.throttle_first or random.random() < self.state.error_rate
+            )
+            if throttle:
+                self.state.throttled += 1
+
+        time.sleep(self.state.latency)
+        if throttle:
+            headers = {}
+            if self.state.retry_after is not None:
+                headers["Retry-After"] = str(self.state.retry_after)
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached (stub)", "type": "rate_limit_error", "code": "rate_limit_exceeded"}},
+                headers,
+            )
+            return
+
+        self._send_json(200, chat_completion(request.get("model", "stub"), self.state.answer))
+
+    def _upload_file(self):
+        # Parse the multipart/form-data body with the stdlib MIME parser
+        head = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8")
+        message = BytesParser(policy=HTTP).parsebytes(head + self._read_body())
+        fields, filename, content = {}, "upload.jsonl", b""
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if name == "file":
+                filename = part.get_filename() or filename
+                content = part.get_payload(decode=True)
+            else:
+                fields[name] = part.get_content().strip()
+        self._send_json(200, self.state.add_file(filename, content, fields.get("purpose", "batch")))
+
+    def _create_batch(self):
+        request = self._read_json()
+        if request.get("input_file_id") not in self.state.files:
+            self._send_json(400, {"error": {"message": "Unknown input_file_id", "type": "invalid_request_error"}})
+            return
+        with self.state.lock:
+            batch_id = f"batch_stub_{len(self.state.batches) + 1}"
+            batch = {
+                "id": batch_id,
+                "object": "batch",
+                "endpoint": request.get("endpoint"),
+                "input_file_id": request["input_file_id"],
+                "completion_window": request.get("completion_window", "24h"),
+                "status": "validating",
+                "created_at": int(time.time()),
+                "output_file_id": None,
+                "error_file_id": None,
+                "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            }
+            self.state.batches[batch_id] = batch
+        threading.Thread(target=self.state.run_batch, args=(batch_id,), daemon=True).start()
+        self._send_json(200, batch)
+
+
+def chat_completion(model, content):
+    """
+    A chat completion response body in the OpenAI format.
+    """
+    return {
+        "id": f"chatcmpl-stub-{random.getrandbits(32):08x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 1, "total_tokens": 1},
+    }
+
+
+class StubServer(ThreadingHTTPServer):
+    # socketserver listens with a backlog of 5, so bursts of hundreds of new
+    # connections (async runs at high concurrency) got refused or reset
+    request_queue_size = 1024
+
+
+def make_server(port=8000, **settings):
+    """
+    Build a stub server bound to localhost:`port` (0 picks a free port).
+    """
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"state": StubState(**settings)})
+    return StubServer(("127.0.0.1", port), handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible stub API.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds to wait before answering")
+    parser.add_argument("--error-rate", type=float, default=0.1, help="Fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=None, help="Retry-After header value for 429s")
+    parser.add_argument("--answer", default="أ", help="Content returned by every completion")
+    parser.add_argument("--throttle-first", type=int, default=0, help="Answer the first N requests with 429")
+    args = parser.parse_args()
+
+    server = make_server(
+        args.port,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        retry_after=args.retry_after,
+        answer=args.answer,
+        throttle_first=args.throttle_first,
+    )
+    logging.info(f"Stub API listening on http://127.0.0.1:{server.server_address[1]}/v1")
+    server.serve_forever()
@@ -1,3 +1,7 @@
+import os
+import re
+import json
+import logging
 import yaml
 import pandas as pd
 
@@ -20,6 +24,86 @@ def load_config(config_path):
         raise ValueError(f"An unexpected error occurred while loading the config: {e}")
 
 
+def load_dataset(dataset_path):
+    """
+    Load a dataset, dispatching on the file extension.
+    Args:
+        dataset_path (str): A JSON array (.json), a CSV file (.csv), or a packed
+            dataset (.pack, see `scripts.packed_dataset`).
+    Returns:
+        list of dict or PackedDataset: Records with `Question`/`Answer` fields.
+        Packed datasets are memory-mapped and decode records on access.
+    """
+    from scripts.packed_dataset import PackedDataset, read_source_records
+
+    extension = os.path.splitext(dataset_path)[1].lower()
+    if extension == ".pack":
+        return PackedDataset(dataset_path)
+    if extension == ".csv":
+        return list(read_source_records(dataset_path))
+    with open(dataset_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def parse_shard(spec):
+    """
+    Parse a shard spec "i/N" (0-based shard i of N).
+    Returns:
+        tuple: (index, count)
+    """
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{spec}': expected i/N, e.g. 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{spec}': index must be in [0, {count})")
+    return index, count
+
+
+def shard_of(item_id, count):
+    """
+    The shard that owns dataset id `item_id` (1-based) out of `count` shards.
+    Ids are dealt round-robin, so every shard gets a similar mix of lengths.
+    """
+    return (item_id - 1) % count
+
+
+def dataset_items(dataset, shard=None):
+    """
+    Yield (id, record) pairs of a dataset, optionally only those of one shard.
+    Ids are 1-based positions in the full dataset, whatever the shard.
+    Args:
+        dataset: Records from `load_dataset`.
+        shard (tuple): Optional (index, count) from `parse_shard`.
+    """
+    if shard is None:
+        yield from enumerate(dataset, start=1)
+    elif hasattr(dataset, "shard"):
+        # Packed datasets only decode the shard's own records
+        yield from dataset.shard(*shard).items()
+    else:
+        index, count = shard
+        for item_id, record in enumerate(dataset, start=1):
+            if shard_of(item_id, count) == index:
+                yield item_id, record
+
+
+def get_shard_path(output_path, shard):
+    """
+    Per-shard predictions path, e.g. `qa_jais.shard-0-of-4.csv` for `qa_jais.csv`.
+    """
+    root, extension = os.path.splitext(output_path)
+    index, count = shard
+    return f"{root}.shard-{index}-of-{count}{extension}"
+
+
+def is_shard_path(path):
+    """
+    True for a per-shard output written by `get_shard_path`.
+    """
+    return re.search(r"\.shard-\d+-of-\d+\.[^.]+$", path) is not None
+
+
 def save_predictions(predictions, output_path):
     """
     Save predictions to a CSV file.
@@ -36,4 +120,42 @@ def save_predictions(predictions, output_path):
         raise IOError(f"Failed to save predictions to {output_path}: {e}")
 
 
+def get_checkpoint_path(output_path):
+    """
+    Derive the append-only JSONL checkpoint path for a predictions CSV.
+    Args:
+        output_path (str): Path of the predictions CSV.
+    Returns:
+        str: Path of the JSONL checkpoint next to the CSV.
+    """
+    root, _ = os.path.splitext(output_path)
+    return f"{root}.jsonl"
+
 
+def load_checkpoint(checkpoint_path):
+    """
+    Load prediction records streamed to a JSONL checkpoint.
+    A truncated last line (e.g. from a crash mid-write) is ignored. An id
+    written more than once (a failed item retried by `--resume`) keeps its
+    last record.
+    Args:
+        checkpoint_path (str): Path of the JSONL checkpoint.
+    Returns:
+        list of dict: Prediction records, one per item.
+    """
+    records = {}
+    if not os.path.exists(checkpoint_path):
+        return []
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logging.warning(f"Ignoring unreadable line {line_number} in {checkpoint_path}")
+                continue
+            records.pop(record["id"], None)  # Order by the latest write
+            records[record["id"]] = record
+    return list(records.values())
@@ -0,0 +1,69 @@
+import json
+import threading
+import pytest
+import yaml
+from models import rate_limit
+from scripts.stub_api_server import make_server
+
+QUESTIONS = [
+    {"Question": f"سؤال {i}\nأ. نعم\nب. لا", "Answer": "أ"}
+    for i in range(4)
+]
+
+
+@pytest.fixture(autouse=True)
+def fresh_limiters(monkeypatch):
+    # Limiters are process-wide per provider; give every test its own budget
+    monkeypatch.setattr(rate_limit, "_limiters", {})
+
+
+@pytest.fixture
+def stub_server():
+    """
+    Start in-process stub API servers; call with `make_server` settings.
+    Returns the server, whose `base_url` and `state` counters the tests use.
+    """
+    servers = []
+
+    def start(**settings):
+        server = make_server(0, **settings)
+        server.base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        server.state = server.RequestHandlerClass.state
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def experiment_config(tmp_path):
+    """
+    Write a QA config for an `openai` model served by a stub server, over a
+    4-question dataset whose answers are all the stub's default answer.
+    Extra keyword arguments become top-level config sections.
+    """
+    def write(server, **sections):
+        dataset_path = tmp_path / "qa.json"
+        dataset_path.write_text(json.dumps(QUESTIONS, ensure_ascii=False), encoding="utf-8")
+        instruction_path = tmp_path / "instruction.txt"
+        instruction_path.write_text("أجب بحرف الخيار الصحيح فقط.", encoding="utf-8")
+        config = {
+            "experiment_name": "qa_stub",
+            "model": {"type": "openai", "name": "stub", "api_key": "test", "base_url": server.base_url},
+            "dataset": {"path": str(dataset_path), "instruction_path": str(instruction_path)},
+            "task": {"type": "qa"},
+            "output": {
+                "predictions_path": str(tmp_path / "qa_stub.csv"),
+                "metrics_path": str(tmp_path / "qa_stub.json"),
+            },
+            **sections,
+        }
+        config_path = tmp_path / "qa_stub.yaml"
+        config_path.write_text(yaml.safe_dump(config, allow_unicode=True), encoding="utf-8")
+        return str(config_path)
+
+    return write
@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+from evaluations.answer_extraction import extract_answer, extract_answers
+
+QUESTION = """ما هو المصدر الرئيسي للطاقة في الجسم؟
+أ. الدهون
+ب. البروتينات
+ج. الكربوهيدرات
+د. الفيتامينات"""
+
+# Hand-labelled model answers and ground truths -> (letter, strategy)
+CASES = [
+    # The whole answer is a letter
+    ("ب", "ب", "exact"),
+    ("**C**", "ج", "exact"),
+    ("(د)", "د", "exact"),
+    ("ه", "هـ", "exact"),
+    ("إ", "أ", "exact"),
+    # A letter and separator at the start
+    ("ب. البروتينات", "ب", "option_prefix"),
+    ("(ج) الكربوهيدرات", "ج", "option_prefix"),
+    ("د) الفيتامينات", "د", "option_prefix"),
+    ("C. Ferritin, iron", "ج", "option_prefix"),
+    ("A) Chorion", "أ", "option_prefix"),
+    # A letter right after the last answer marker
+    ("الإجابة الصحيحة هي: ب", "ب", "answer_marker"),
+    ("الجواب: د", "د", "answer_marker"),
+    ("Correct letter: C", "ج", "answer_marker"),
+    ("The answer is B.", "ب", "answer_marker"),
+    ("Q: ...\nA: ج\n\nQ: ...\nA: ب", "ب", "answer_marker"),
+    # Letters in free text are not answers
+    ("Vitamin D deficiency", None, "none"),
+    ("فيتامين د", None, "none"),
+    ("Hepatitis A", None, "none"),
+    ("Therefore, the exception is B.", None, "none"),
+    ("E. coli infection", None, "none"),
+    ("B-cell lymphoma", None, "none"),
+    ("نقص فيتامين د يسبب لين العظام", None, "none"),
+    # Empty labels of an echoed prompt are not answers
+    ("A:\nB:", None, "none"),
+    ("A: \n B:", None, "none"),
+    ("A:", None, "none"),
+    ("", None, "none"),
+    (None, None, "none"),
+]
+
+
+@pytest.mark.parametrize("text, letter, strategy", CASES)
+def test_extract_answer(text, letter, strategy):
+    extraction = extract_answer(text)
+    assert (extraction.letter, extraction.strategy) == (letter, strategy)
+
+
+def test_option_text_needs_the_question():
+    assert extract_answer("الكربوهيدرات").letter is None
+    extraction = extract_answer("الكربوهيدرات", QUESTION)
+    assert (extraction.letter, extraction.strategy, extraction.confidence) == ("ج", "option_text", "medium")
+
+
+def test_extract_answers_keeps_index_and_uses_inputs():
+    texts = pd.Series(["ب", "الكربوهيدرات", "Vitamin D deficiency"], index=[10, 11, 12])
+    inputs = pd.Series([QUESTION] * 3, index=texts.index)
+    extracted = extract_answers(texts, inputs)
+    assert list(extracted.index) == [10, 11, 12]
+    assert list(extracted["strategy"]) == ["exact", "option_text", "none"]
+    assert list(extracted["letter"][:2]) == ["ب", "ج"]
+    assert pd.isna(extracted["letter"].iloc[2])
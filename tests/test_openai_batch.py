@@ -0,0 +1,43 @@
+import json
+import pandas as pd
+import pytest
+
+pytest.importorskip("openai")
+
+from scripts.run_experiment import run_experiment
+
+BATCH = {"mode": "batch", "poll_interval": 0.05}
+
+
+def test_batch_mode_maps_results_to_ids(stub_server, experiment_config, tmp_path):
+    server = stub_server()
+    metrics = run_experiment(experiment_config(server, execution=BATCH))
+
+    predictions = pd.read_csv(tmp_path / "qa_stub.csv", dtype=str, keep_default_na=False)
+    assert list(predictions["id"]) == ["1", "2", "3", "4"]
+    assert list(predictions["prediction"]) == ["أ"] * 4
+    assert metrics["accuracy"] == 1.0
+
+    # One batch carrying every item, and no online requests
+    assert server.state.requests == 0
+    [batch] = server.state.batches.values()
+    assert batch["request_counts"] == {"total": 4, "completed": 4, "failed": 0}
+    with open(tmp_path / "qa_stub.batch_input.jsonl", encoding="utf-8") as f:
+        requests = [json.loads(line) for line in f]
+    assert [request["custom_id"] for request in requests] == ["1", "2", "3", "4"]
+    assert requests[0]["body"]["model"] == "stub"
+
+
+def test_batch_resume_submits_only_failed_ids(stub_server, experiment_config, tmp_path):
+    server = stub_server(throttle_first=2)
+    run_experiment(experiment_config(server, rate_limit={"max_retries": 0}))
+    assert server.state.requests == 4
+
+    metrics = run_experiment(experiment_config(server, rate_limit={"max_retries": 0}, execution=BATCH), resume=True)
+    predictions = pd.read_csv(tmp_path / "qa_stub.csv", dtype=str, keep_default_na=False)
+    assert list(predictions["prediction"]) == ["أ"] * 4
+    assert metrics["accuracy"] == 1.0
+
+    [batch] = server.state.batches.values()
+    assert batch["request_counts"]["total"] == 2
+    assert server.state.requests == 4
@@ -0,0 +1,88 @@
+import time
+import asyncio
+import pandas as pd
+import pytest
+
+pytest.importorskip("openai")
+
+from models.openai_handler import OpenAIHandler
+from models.rate_limit import ProviderLimiter
+from scripts.run_experiment import run_experiment
+
+
+def make_handler(server, **rate_limit):
+    return OpenAIHandler(api_key="test", model="stub", base_url=server.base_url, rate_limit=rate_limit)
+
+
+def test_throttled_requests_are_retried(stub_server):
+    server = stub_server(throttle_first=2, retry_after=0)
+    handler = make_handler(server)
+    assert handler.prompt("سؤال", "تعليمات") == "أ"
+    assert (server.state.requests, server.state.throttled) == (3, 2)
+    assert (handler.limiter.retries, handler.limiter.throttled) == (2, 2)
+
+
+def test_retry_after_is_honoured(stub_server):
+    server = stub_server(throttle_first=1, retry_after=0.5)
+    # Without the header the jittered backoff could wait up to 30s
+    handler = make_handler(server, base_delay=30)
+    start = time.perf_counter()
+    assert handler.prompt("سؤال", "تعليمات") == "أ"
+    assert 0.5 <= time.perf_counter() - start < 5
+    assert server.state.requests == 2
+
+
+def test_failed_request_gives_up_after_max_retries(stub_server):
+    server = stub_server(error_rate=1.0, retry_after=0)
+    handler = make_handler(server, max_retries=2)
+    assert handler.prompt("سؤال", "تعليمات") is None
+    assert server.state.requests == 3
+    assert handler.limiter.retries == 2
+
+
+def test_throttling_halves_concurrency(stub_server):
+    server = stub_server(throttle_first=1, retry_after=0)
+    handler = make_handler(server, max_concurrency=8)
+    assert handler.prompt("سؤال", "تعليمات") == "أ"
+    assert handler.limiter.concurrency.limit == 4
+    assert handler.limiter.concurrency.in_flight == 0
+
+
+def test_async_requests_respect_max_concurrency(stub_server):
+    server = stub_server(latency=0.05)
+    handler = make_handler(server, max_concurrency=4)
+
+    async def run():
+        return await asyncio.gather(*(handler.aprompt(f"سؤال {i}", "تعليمات") for i in range(20)))
+
+    start = time.perf_counter()
+    assert asyncio.run(run()) == ["أ"] * 20
+    # 20 requests of 50ms, at most 4 in flight
+    assert time.perf_counter() - start >= 0.25
+    assert server.state.requests == 20
+    assert handler.limiter.concurrency.in_flight == 0
+
+
+def test_requests_per_minute_budget():
+    limiter = ProviderLimiter("test", requests_per_minute=60)
+    assert all(limiter.wait_time() == 0 for _ in range(60))
+    assert limiter.wait_time() == pytest.approx(1.0, abs=0.05)
+
+
+def test_resume_retries_only_failed_requests(stub_server, experiment_config, tmp_path):
+    server = stub_server(throttle_first=2)
+    config_path = experiment_config(server, rate_limit={"max_retries": 0})
+
+    metrics = run_experiment(config_path)
+    predictions = pd.read_csv(tmp_path / "qa_stub.csv", dtype=str, keep_default_na=False)
+    assert list(predictions["prediction"]) == ["", "", "أ", "أ"]
+    assert metrics["accuracy"] == 0.5
+    assert server.state.requests == 4
+
+    metrics = run_experiment(config_path, resume=True)
+    predictions = pd.read_csv(tmp_path / "qa_stub.csv", dtype=str, keep_default_na=False)
+    assert list(predictions["id"]) == ["1", "2", "3", "4"]
+    assert list(predictions["prediction"]) == ["أ"] * 4
+    assert metrics["accuracy"] == 1.0
+    # Only the two failed ids were sent again
+    assert server.state.requests == 6